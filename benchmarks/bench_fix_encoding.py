@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark fix_encoding() against the sequential replacement loop
+
+The reference implementation applies REPLACEMENTS with one text.replace()
+per pair, as fix_encoding() originally did. Before timing anything the
+script checks that the compiled table gives exactly the same results on
+the fix_encoding.py test cases and on every text node of the real export
+(the recorded corpus), then reports throughput in MB/s on post bodies,
+for the table alone and for the whole function (which now also runs the
+generic decode_mojibake() step).
+
+Usage (from the repository root):
+    python benchmarks/bench_fix_encoding.py [--repeat 50] [--rounds 3]
+"""
+
+import argparse
+import html
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fix_encoding import (  # noqa: E402
+    REPLACEMENTS, TEST_CASES, _COMPILED_REPLACEMENTS, fix_encoding,
+)
+
+EXPORT = Path(__file__).resolve().parent.parent / 'bibliotecaarchimedica.wordpress.2016-03-26.xml'
+CONTENT_TAG = '{http://purl.org/rss/1.0/modules/content/}encoded'
+
+def sequential_table(text):
+    """Only the replacement table, one replace() per pair"""
+    for old, new in REPLACEMENTS:
+        text = text.replace(old, new)
+    return text
+
+def reference_fix_encoding(text):
+    """The original fix_encoding(): only the table, one replace() at a time"""
+    if not text:
+        return text
+
+    text = sequential_table(html.unescape(text))
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s+([.,;:!?])', r'\1', text)
+    return text.strip()
+
+def compiled_table(text):
+    """Only the replacement table, through the compiled passes"""
+    for pattern, repl in _COMPILED_REPLACEMENTS:
+        text = pattern.sub(repl, text)
+    return text
+
+def load_corpus():
+    """Every non-empty text node of the real export, plus the post bodies"""
+    root = ET.parse(EXPORT).getroot()
+    texts = [elem.text for elem in root.iter() if elem.text and elem.text.strip()]
+    bodies = [elem.text for elem in root.iter(CONTENT_TAG) if elem.text]
+    return texts, bodies
+
+def check_equivalence(texts):
+    """Fail loudly if the compiled table differs from the sequential one anywhere"""
+    inputs = [original for original, _ in TEST_CASES] + texts
+    for text in inputs:
+        text = html.unescape(text)
+        if compiled_table(text) != sequential_table(text):
+            raise SystemExit(f"Mismatch on: {text[:80]!r}")
+    return len(inputs)
+
+def throughput(function, bodies, rounds):
+    """Best MB/s (of UTF-8 input) over several rounds"""
+    size = sum(len(body.encode('utf-8')) for body in bodies)
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for body in bodies:
+            function(body)
+        best = min(best, time.perf_counter() - start)
+    return size / best / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fix_encoding()')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='how many times to repeat the post bodies')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='timing rounds per implementation (best is reported)')
+    args = parser.parse_args()
+
+    texts, bodies = load_corpus()
+    checked = check_equivalence(texts)
+    print(f"Compiled table identical to sequential on {checked} strings")
+
+    bodies = bodies * args.repeat
+    size = sum(len(body.encode('utf-8')) for body in bodies)
+    print(f"Post bodies: {len(bodies)} ({size / 1e6:.1f} MB)")
+
+    for label, reference, compiled in [
+        ('Replacement table only', sequential_table, compiled_table),
+        ('Whole fix_encoding()', reference_fix_encoding, fix_encoding),
+    ]:
+        before = throughput(reference, bodies, args.rounds)
+        after = throughput(compiled, bodies, args.rounds)
+        print(f"\n{label}")
+        print(f"  Sequential replace(): {before:8.1f} MB/s")
+        print(f"  Current:              {after:8.1f} MB/s")
+        print(f"  Speedup:              {after / before:8.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark the WXR item extractor in parse_wordpress_xml.py
+
+Builds a large synthetic export by repeating the items of the real export,
+then compares the single-pass read_item() against the previous extractor
+(one find()/findall() per field) in items/sec, and checks that both produce
+exactly the same posts.
+
+Usage (from the repository root):
+    python benchmarks/bench_parse_wordpress_xml.py [--copies 200] [--rounds 3]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from parse_wordpress_xml import iter_items, namespaces, read_item, repair_post  # noqa: E402
+
+EXPORT = Path(__file__).resolve().parent.parent / 'bibliotecaarchimedica.wordpress.2016-03-26.xml'
+
+def find_extract(item):
+    """The previous extractor: one find()/findall() per field"""
+    post_type = item.find('wp:post_type', namespaces)
+    if post_type is None or post_type.text != 'post':
+        return None
+
+    status = item.find('wp:status', namespaces)
+    if status is None or status.text != 'publish':
+        return None
+
+    post = {}
+
+    title_elem = item.find('title')
+    post['title'] = title_elem.text if title_elem is not None and title_elem.text else 'Untitled'
+
+    link_elem = item.find('link')
+    post['url'] = link_elem.text if link_elem is not None else ''
+
+    pubdate_elem = item.find('pubDate')
+    post['date'] = pubdate_elem.text if pubdate_elem is not None else ''
+
+    creator_elem = item.find('dc:creator', namespaces)
+    post['author'] = creator_elem.text if creator_elem is not None else 'Unknown'
+
+    content_elem = item.find('content:encoded', namespaces)
+    post['content'] = content_elem.text if content_elem is not None and content_elem.text else ''
+
+    excerpt_elem = item.find('excerpt:encoded', namespaces)
+    post['excerpt'] = excerpt_elem.text if excerpt_elem is not None and excerpt_elem.text else ''
+
+    post_name = item.find('wp:post_name', namespaces)
+    post['slug'] = post_name.text if post_name is not None and post_name.text else ''
+
+    post_id = item.find('wp:post_id', namespaces)
+    post['id'] = post_id.text if post_id is not None else ''
+
+    guid = item.find('guid')
+    post['guid'] = guid.text if guid is not None and guid.text else ''
+
+    post['categories'] = [c.text for c in item.findall('category[@domain="category"]') if c.text]
+    post['tags'] = [t.text for t in item.findall('category[@domain="post_tag"]') if t.text]
+
+    return post
+
+def make_synthetic_export(path, copies):
+    """Write an export containing every item of the real one `copies` times"""
+    source = EXPORT.read_text(encoding='utf-8')
+    start = source.index('<item>')
+    end = source.rindex('</item>') + len('</item>')
+    items = source[start:end]
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source[:start])
+        for _ in range(copies):
+            f.write(items)
+        f.write(source[end:])
+
+def time_extractor(extract, path, rounds):
+    """Best items/sec over several rounds, timing only the extractor"""
+    best = 0.0
+    count = 0
+    for _ in range(rounds):
+        elapsed = 0.0
+        count = 0
+        for item in iter_items(path):
+            start = time.perf_counter()
+            extract(item)
+            elapsed += time.perf_counter() - start
+            count += 1
+        best = max(best, count / elapsed)
+    return count, best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the WXR item extractor')
+    parser.add_argument('--copies', type=int, default=200,
+                        help='how many times to repeat the real export items')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='timing rounds per extractor (best is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'synthetic.xml'
+        make_synthetic_export(path, args.copies)
+        print(f"Synthetic export: {path.stat().st_size / 1e6:.1f} MB")
+
+        # Both extractors must agree on every item, including after repair
+        for item in iter_items(path):
+            old, new = find_extract(item), read_item(item)
+            if old != new or (new is not None and repair_post(old) != repair_post(new)):
+                raise SystemExit(f"Mismatch on item: {old and old['id']}")
+        print("Outputs identical")
+
+        count, before = time_extractor(find_extract, path, args.rounds)
+        _, after = time_extractor(read_item, path, args.rounds)
+
+    print(f"Items: {count}")
+    print(f"find() per field:   {before:12,.0f} items/sec")
+    print(f"single-pass walk:   {after:12,.0f} items/sec")
+    print(f"Speedup:            {after / before:12.2f}x")
+
+if __name__ == '__main__':
+    main()
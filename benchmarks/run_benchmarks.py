@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Benchmark every build stage on a synthetic export, against a saved baseline
+
+Generates an export with synthetic_wxr.py, then measures:
+  parse_wordpress_xml   whole-export parse and repair, in posts/sec
+  fix_encoding          repair of the raw text fields, in MB/s of input
+  create_article_html   page rendering of the parsed posts, in pages/sec
+
+Each stage is timed over several rounds (best is kept), then run once more
+under tracemalloc for its peak Python memory. --save writes the results to
+a JSON baseline; --compare runs the same benchmarks and exits with status 1
+if any stage got slower, or its peak grew, by more than --tolerance. The
+generator options are saved with the baseline and must match.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --save            # on the reference commit
+    python benchmarks/run_benchmarks.py --compare         # on the change
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fix_encoding import fix_encoding  # noqa: E402
+from generate_article_pages import create_article_html  # noqa: E402
+from parse_wordpress_xml import iter_items, parse_wordpress_xml, read_item  # noqa: E402
+from synthetic_wxr import add_arguments, write_synthetic_export  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+# Each benchmark takes the export path and the prepared corpus, and returns
+# how many units of work it did
+
+def bench_parse(path, _):
+    """Parse and repair the whole export"""
+    return len(parse_wordpress_xml(path))
+
+def bench_fix_encoding(_, corpus):
+    """Repair every raw text field"""
+    for text in corpus['texts']:
+        fix_encoding(text)
+    return corpus['text_bytes']
+
+def bench_render(_, corpus):
+    """Render the page of every post"""
+    for post in corpus['posts']:
+        create_article_html(post)
+    return len(corpus['posts'])
+
+# name -> (function, unit, scale of the count returned)
+BENCHMARKS = {
+    'parse_wordpress_xml': (bench_parse, 'posts/s', 1),
+    'fix_encoding': (bench_fix_encoding, 'MB/s', 1e-6),
+    'create_article_html': (bench_render, 'pages/s', 1),
+}
+
+def load_corpus(path):
+    """The inputs of the stage benchmarks, prepared outside the timed code"""
+    texts = []
+    for item in iter_items(path):
+        post = read_item(item)
+        if post is not None:
+            texts.extend([post['title'], post['author'], post['content'], post['excerpt']])
+            texts.extend(post['categories'] + post['tags'])
+    return {
+        'texts': texts,
+        'text_bytes': sum(len(text.encode('utf-8')) for text in texts),
+        'posts': parse_wordpress_xml(path),
+    }
+
+def run_benchmark(function, path, corpus, rounds):
+    """(best count per second, tracemalloc peak in bytes) of one benchmark"""
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = function(path, corpus)
+        best = max(best, count / (time.perf_counter() - start))
+
+    tracemalloc.start()
+    try:
+        function(path, corpus)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def compare(results, baseline, tolerance):
+    """Lines describing each stage against the baseline, and whether any regressed"""
+    lines = []
+    regressed = False
+    for name, result in results.items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            lines.append(f"  {name}: not in the baseline")
+            continue
+        speed = result['throughput'] / reference['throughput']
+        memory = result['peak_kb'] / reference['peak_kb'] if reference['peak_kb'] else 1.0
+        failed = speed < 1 - tolerance or memory > 1 + tolerance
+        regressed = regressed or failed
+        lines.append(f"{'✗' if failed else '✓'} {name}: {speed:6.2f}x throughput, "
+                     f"{memory:6.2f}x peak memory")
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the build stages')
+    add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='timing rounds per stage (best is kept, default: %(default)s)')
+    parser.add_argument('--only', choices=sorted(BENCHMARKS), action='append',
+                        help='run only this stage (repeatable)')
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='write the results as the baseline (default: %s)' % DEFAULT_BASELINE.name)
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='fail if a stage regressed against this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed slowdown or memory growth, as a fraction '
+                             '(default: %(default)s)')
+    args = parser.parse_args()
+
+    params = {
+        'posts': args.posts,
+        'body_size': args.body_size,
+        'mojibake': args.mojibake,
+        'categories': args.categories,
+        'tags': args.tags,
+        'seed': args.seed,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            raise SystemExit(f"Generator options differ from the baseline: {baseline['params']}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'synthetic.xml'
+        size = write_synthetic_export(path, args.posts, args.body_size, args.mojibake,
+                                      args.categories, args.tags, args.seed)
+        corpus = load_corpus(path)
+        print(f"Synthetic export: {args.posts} items, {len(corpus['posts'])} posts, "
+              f"{size / 1e6:.1f} MB\n")
+
+        results = {}
+        for name in args.only or BENCHMARKS:
+            function, unit, scale = BENCHMARKS[name]
+            throughput, peak = run_benchmark(function, path, corpus, args.rounds)
+            results[name] = {
+                'throughput': round(throughput * scale, 3),
+                'unit': unit,
+                'peak_kb': round(peak / 1024, 1),
+            }
+            print(f"{name:<22} {throughput * scale:12,.1f} {unit:<8} "
+                  f"peak {peak / 1024:10,.1f} KB")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'python': platform.python_version(),
+                       'results': results}, f, indent=1)
+        print(f"\nBaseline saved to {args.save}")
+
+    if baseline is not None:
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print(f"\nAgainst {args.compare} (tolerance {args.tolerance:.0%}):")
+        print('\n'.join(lines))
+        if regressed:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
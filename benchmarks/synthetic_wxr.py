@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic WordPress WXR export of any size
+
+The export has the structure of the real one (same namespaces, channel
+header, item children and category markup), with Italian-looking post
+bodies made of paragraphs, links, images and entities. Text is drawn from
+a seeded generator, so the same options always give the same file.
+
+The mojibake density is the fraction of words written double-encoded
+(UTF-8 read as cp1252, like 'città' -> 'cittÃ '), the damage fix_encoding()
+repairs in the real export. One item in ten is an attachment or a draft,
+so the extractor's skip path is exercised as well.
+
+Usage (from the repository root):
+    python benchmarks/synthetic_wxr.py out.xml [--posts 1000] [--body-size 4000]
+        [--mojibake 0.02] [--categories 8] [--tags 40] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+WORDS = '''
+    biblioteca libro libri autore autrice lettura presentazione evento isola
+    avatar second life mondo virtuale serata incontro ospiti pubblico romanzo
+    racconto concorso premiazione giuria poesia musica arte storia cultura
+    scuola didattica rete web comunità metaverso sala scaffale volume pagina
+    il la le gli un una di da in con per su tra fra che non come anche molto
+'''.split()
+
+# Words with the characters the real export gets wrong
+ACCENTED = '''
+    città perché più è già però così virtualità attività novità libertà
+    “citazione” ‘nota’ dell’autore – … caffè società identità
+'''.split()
+
+DOMAINS = ['www.archimedix.eu', 'farm1.static.flickr.com', 'www.tuttiscrittori.it',
+           'biblioteca.archimedica.eu']
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8" ?>
+<!-- generator="benchmarks/synthetic_wxr.py" -->
+<rss version="2.0"
+\txmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
+\txmlns:content="http://purl.org/rss/1.0/modules/content/"
+\txmlns:wfw="http://wellformedweb.org/CommentAPI/"
+\txmlns:dc="http://purl.org/dc/elements/1.1/"
+\txmlns:wp="http://wordpress.org/export/1.2/"
+>
+
+<channel>
+\t<title>Biblioteca Archimedica</title>
+\t<link>http://biblioteca.archimedix.net</link>
+\t<description>La biblioteca virtuale su second life</description>
+\t<language>en-US</language>
+\t<wp:wxr_version>1.2</wp:wxr_version>
+'''
+
+FOOTER = '''</channel>
+</rss>
+'''
+
+ITEM = '''\t<item>
+\t\t<title>{title}</title>
+\t\t<link>http://biblioteca.archimedix.net/{path}/</link>
+\t\t<pubDate>{pubdate}</pubDate>
+\t\t<dc:creator><![CDATA[{author}]]></dc:creator>
+\t\t<guid isPermaLink="false">http://biblioteca.archimedix.net/?p={post_id}</guid>
+\t\t<description></description>
+\t\t<content:encoded><![CDATA[{content}]]></content:encoded>
+\t\t<excerpt:encoded><![CDATA[{excerpt}]]></excerpt:encoded>
+\t\t<wp:post_id>{post_id}</wp:post_id>
+\t\t<wp:post_name><![CDATA[{slug}]]></wp:post_name>
+\t\t<wp:status><![CDATA[{status}]]></wp:status>
+\t\t<wp:post_type><![CDATA[{post_type}]]></wp:post_type>
+{terms}\t</item>
+'''
+
+def mojibake(word):
+    """
+    A word as it looks once its UTF-8 bytes are read back as cp1252, bytes
+    cp1252 leaves undefined passing through as latin-1
+    """
+    chars = []
+    for byte in word.encode('utf-8'):
+        try:
+            chars.append(bytes([byte]).decode('cp1252'))
+        except UnicodeDecodeError:
+            chars.append(chr(byte))
+    return ''.join(chars)
+
+class SyntheticExport:
+    """Seeded source of synthetic post fields"""
+
+    def __init__(self, body_size=4000, mojibake_density=0.02, categories=8, tags=40, seed=0):
+        self.random = random.Random(seed)
+        self.body_size = body_size
+        self.mojibake_density = mojibake_density
+        self.categories = [f'Categoria {i}' for i in range(categories)]
+        self.tags = [f'tag{i}' for i in range(tags)]
+
+    def word(self):
+        r = self.random.random()
+        if r < self.mojibake_density:
+            return mojibake(self.random.choice(ACCENTED))
+        if r < self.mojibake_density * 2:
+            return self.random.choice(ACCENTED)
+        return self.random.choice(WORDS)
+
+    def sentence(self, words):
+        text = ' '.join(self.word() for _ in range(words))
+        return text[0].upper() + text[1:] + '.'
+
+    def paragraph(self):
+        parts = [self.sentence(self.random.randint(6, 18)) for _ in range(self.random.randint(2, 5))]
+        r = self.random.random()
+        if r < 0.3:
+            url = f'http://{self.random.choice(DOMAINS)}/{self.random.choice(WORDS)}.html'
+            parts.insert(1, f'<a href="{url}">{self.word()} {self.word()}</a>')
+        elif r < 0.4:
+            parts.insert(1, f'<strong>{self.word()}</strong> &amp; {self.word()}')
+        return ' '.join(parts)
+
+    def body(self):
+        """HTML body of about body_size characters, images between paragraphs"""
+        paragraphs = []
+        size = 0
+        while size < self.body_size:
+            paragraph = self.paragraph()
+            if self.random.random() < 0.15:
+                name = f'{self.random.randrange(10**6)}_{self.random.choice(WORDS)}.jpg'
+                paragraph += (f'\n\n<img src="http://{self.random.choice(DOMAINS)}/img/{name}" '
+                              f'height="{self.random.randint(200, 400)}" width="500" />')
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        return '\n\n'.join(paragraphs)
+
+    def terms(self):
+        lines = []
+        for name in self.random.sample(self.categories, min(len(self.categories), self.random.randint(1, 2))):
+            nicename = name.lower().replace(' ', '-')
+            lines.append(f'\t\t<category domain="category" nicename="{nicename}"><![CDATA[{name}]]></category>\n')
+        for name in self.random.sample(self.tags, min(len(self.tags), self.random.randint(0, 5))):
+            lines.append(f'\t\t<category domain="post_tag" nicename="{name}"><![CDATA[{name}]]></category>\n')
+        return ''.join(lines)
+
+    def item(self, number, date):
+        title = self.sentence(self.random.randint(2, 6))[:-1]
+        slug = f'post-{number}'
+        kind = self.random.random()
+        post_type, status = 'post', 'publish'
+        if kind < 0.05:
+            post_type = 'attachment'
+        elif kind < 0.1:
+            status = 'draft'
+        return ITEM.format(
+            title=escape(title),
+            path=f'{date:%Y/%m/%d}/{slug}',
+            pubdate=format_datetime(date),
+            author=self.random.choice(['archimedix', 'fiona', 'Mattia Crenshaw']),
+            content=self.body(),
+            excerpt=self.sentence(12) if self.random.random() < 0.2 else '',
+            post_id=number,
+            slug=slug,
+            status=status,
+            post_type=post_type,
+            terms=self.terms(),
+        )
+
+def write_synthetic_export(path, posts=1000, body_size=4000, mojibake_density=0.02,
+                           categories=8, tags=40, seed=0):
+    """
+    Write a synthetic export of `posts` items to path, one item at a time,
+    a few hours to a few days apart. Returns the size of the file in bytes.
+    """
+    source = SyntheticExport(body_size, mojibake_density, categories, tags, seed)
+    date = datetime(2006, 11, 1, 12, 0, tzinfo=timezone.utc)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(HEADER)
+        for number in range(1, posts + 1):
+            date += timedelta(minutes=source.random.randint(60, 3 * 24 * 60))
+            f.write(source.item(number, date))
+        f.write(FOOTER)
+    return os.path.getsize(path)
+
+def add_arguments(parser):
+    """The generator options, shared with the benchmark runner"""
+    parser.add_argument('--posts', type=int, default=1000,
+                        help='items in the export (default: %(default)s)')
+    parser.add_argument('--body-size', type=int, default=4000,
+                        help='approximate characters per post body (default: %(default)s)')
+    parser.add_argument('--mojibake', type=float, default=0.02,
+                        help='fraction of words written double-encoded (default: %(default)s)')
+    parser.add_argument('--categories', type=int, default=8,
+                        help='distinct categories (default: %(default)s)')
+    parser.add_argument('--tags', type=int, default=40,
+                        help='distinct tags (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic WordPress WXR export')
+    parser.add_argument('output', help='path of the export to write')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    size = write_synthetic_export(args.output, args.posts, args.body_size, args.mojibake,
+                                  args.categories, args.tags, args.seed)
+    print(f"Wrote {args.posts} items to {args.output} ({size / 1e6:.1f} MB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Build the whole newsite from the WordPress export in one streaming pass
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import chain
+from pathlib import Path
+import fix_encoding as encoding
+import compress_assets
+import extract_utility_css
+import image_derivatives
+from generate_article_pages import (
+    ImageIndex, article_digest, article_slug, create_article_html, load_page_manifest,
+    iter_write_pages, remove_stale_pages, save_page_manifest, template_version, write_atomic)
+from generate_listing_index import generate_listing_index
+from parse_wordpress_xml import iter_items, read_item, read_posts_jsonl, repair_posts
+from search_index import build_search_index
+
+class Stage:
+    """
+    Wall time, CPU time (of this process) and item count of one build stage.
+
+    A streaming stage wraps the iterator of the stage before it with
+    timed(): the time spent getting each item includes the upstream
+    stages, whose share is subtracted so every stage reports its own work.
+    A stage that runs in one go is timed with measure().
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.upstream = None
+        self.count = 0
+        self._wall = 0.0
+        self._cpu = 0.0
+
+    @property
+    def wall(self):
+        return self._wall - (self.upstream._wall if self.upstream else 0.0)
+
+    @property
+    def cpu(self):
+        return self._cpu - (self.upstream._cpu if self.upstream else 0.0)
+
+    def timed(self, items, upstream=None):
+        """Yield items, timing how long each took to produce"""
+        self.upstream = upstream
+        items = iter(items)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self._wall += time.perf_counter() - wall
+                self._cpu += time.process_time() - cpu
+            self.count += 1
+            yield item
+
+    @contextmanager
+    def measure(self):
+        """Time the body of a with block; set count inside it"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            self._wall += time.perf_counter() - wall
+            self._cpu += time.process_time() - cpu
+
+def spool_posts(posts, f, keys):
+    """
+    Write posts to the open binary file f as JSON Lines, in document order,
+    while recording (timestamp, offset, length) of each one in keys: enough
+    to put them in date order afterwards without holding them in memory.
+    """
+    for post in posts:
+        line = (json.dumps(post, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        keys.append((post['timestamp'], f.tell(), len(line)))
+        f.write(line)
+        yield post
+
+def write_sorted_posts(spool, keys, output):
+    """
+    Copy the posts from the open spool file to output newest first, like
+    parse_wordpress_xml() sorts them (a stable sort, so posts with the same
+    date keep document order). Returns the number of posts written.
+    """
+    keys = sorted(keys, key=lambda key: key[0], reverse=True)
+    output = Path(output)
+    fd, tmp = tempfile.mkstemp(dir=output.parent, prefix=f'.{output.name}.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        for _, offset, length in keys:
+            spool.seek(offset)
+            out.write(spool.read(length))
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, output)
+    return len(keys)
+
+def build_site(xml_file, posts_file, site, jobs=1, force=False, compress=True):
+    """
+    Build the site under site/ from a WordPress export, returning the
+    Stage of every step in the order they ran.
+
+    Posts stream through parse, encoding repair, rendering and writing one
+    at a time; on the way they are spooled to a temporary JSON Lines file.
+    Only the steps that need the posts in date order wait for the end of
+    the stream: the sorted posts_file is written from the spool, and the
+    listing and search indexes read it back lazily. Pages whose article
+    and template are unchanged are not rendered again, sharing
+    articles/.manifest.json with generate_article_pages.py.
+
+    With jobs other than 1 every parallel stage uses a pool of worker
+    processes (0 = one per CPU): encoding repair and rendering as in
+    parse_wordpress_xml.py and generate_article_pages.py -j, where pages
+    are rendered and written in the same worker, so there is no separate
+    write stage, as well as image derivation and compression.
+    """
+    site = Path(site)
+    articles_dir = site / 'articles'
+    articles_dir.mkdir(parents=True, exist_ok=True)
+    derived_dir = site / 'images' / 'derived'
+    stages = {name: Stage(name) for name in (
+        'images', 'parse', 'repair', 'render', 'write', 'sort', 'listing', 'search',
+        'css', 'compress')}
+
+    with stages['images'].measure() as stage:
+        if image_derivatives.Image is not None:
+            derived, cached, _, _, failed = image_derivatives.build_derivatives(
+                image_derivatives.SOURCES, derived_dir, jobs)
+            stage.count = derived + cached
+            for error in failed:
+                print(f"  skipped unreadable image {error}")
+    images = ImageIndex(
+        image_derivatives.load_image_manifest(derived_dir / image_derivatives.MANIFEST_NAME),
+        prefix=os.path.relpath(derived_dir, articles_dir) + '/')
+
+    manifest_path = articles_dir / '.manifest.json'
+    version = template_version(images)
+    previous_version, previous = load_page_manifest(manifest_path)
+    unchanged_ok = {} if force or previous_version != version else previous
+    pages = {}
+
+    def changed(posts):
+        for post in posts:
+            filename = f"{article_slug(post)}.html"
+            digest = article_digest(post)
+            pages[filename] = digest
+            if unchanged_ok.get(filename) == digest and (articles_dir / filename).exists():
+                continue
+            yield filename, post
+
+    def render(entries):
+        for filename, post in entries:
+            yield filename, create_article_html(post, images)
+
+    def write(rendered):
+        for filename, text in rendered:
+            write_atomic(articles_dir / filename, text)
+            yield filename
+
+    keys = []
+    with tempfile.TemporaryFile(dir=Path(posts_file).parent) as spool_file:
+        raw = (post for post in map(read_item, iter_items(xml_file)) if post is not None)
+        parsed = stages['parse'].timed(raw)
+        repaired = stages['repair'].timed(
+            spool_posts(repair_posts(parsed, jobs), spool_file, keys), stages['parse'])
+        if jobs == 1:
+            rendered = stages['render'].timed(render(changed(repaired)), stages['repair'])
+            for _ in stages['write'].timed(write(rendered), stages['render']):
+                pass
+        else:
+            del stages['write']
+            posts = (post for _, post in changed(repaired))
+            written = chain.from_iterable(iter_write_pages(posts, articles_dir, jobs, images=images))
+            for _ in stages['render'].timed(written, stages['repair']):
+                pass
+        remove_stale_pages(articles_dir, previous, pages)
+        save_page_manifest(manifest_path, version, pages)
+
+        with stages['sort'].measure() as stage:
+            stage.count = write_sorted_posts(spool_file, keys, posts_file)
+
+    with stages['listing'].measure() as stage:
+        stage.count = len(generate_listing_index(read_posts_jsonl(posts_file), site / 'index'))
+
+    with stages['search'].measure() as stage:
+        stage.count, _, _ = build_search_index(read_posts_jsonl(posts_file), site / 'search')
+
+    with stages['css'].measure() as stage:
+        sources = extract_utility_css.site_sources(site)
+        css, _ = extract_utility_css.build_stylesheet(extract_utility_css.scan_classes(sources))
+        (site / 'css' / 'utilities.css').write_text(css, encoding='utf-8')
+        stage.count = len(sources)
+
+    if compress:
+        with stages['compress'].measure() as stage:
+            stage.count, _, _, _, _ = compress_assets.compress_assets(site, jobs, force)
+    else:
+        del stages['compress']
+
+    return list(stages.values())
+
+def format_timings(stages, children_cpu=0.0):
+    """The per-stage report printed at the end of a build"""
+    lines = [f"{'stage':<10} {'items':>7} {'wall':>9} {'cpu':>9}"]
+    for stage in stages:
+        lines.append(f"{stage.name:<10} {stage.count:>7} {stage.wall:>8.3f}s {stage.cpu:>8.3f}s")
+    lines.append(f"{'total':<10} {'':>7} {sum(s.wall for s in stages):>8.3f}s "
+                 f"{sum(s.cpu for s in stages):>8.3f}s")
+    if children_cpu >= 0.0005:
+        lines.append(f"(+ {children_cpu:.3f}s CPU in worker processes)")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('xml_file', nargs='?',
+                        default='bibliotecaarchimedica.wordpress.2016-03-26.xml',
+                        help='WordPress WXR export to build from')
+    parser.add_argument('--posts', default='wordpress_posts.jsonl',
+                        help='JSON Lines file the posts are saved to, newest first '
+                             '(default: %(default)s)')
+    parser.add_argument('--site', default='newsite',
+                        help='directory of the static site (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes for encoding repair, rendering, images '
+                             'and compression (0 = one per CPU, default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='render every page and recompress every asset, changed '
+                             'or not (image derivatives stay cached by content)')
+    parser.add_argument('--no-compress', dest='compress', action='store_false',
+                        help='skip writing the .gz/.br siblings')
+    args = parser.parse_args()
+
+    before = os.times()
+    stages = build_site(args.xml_file, args.posts, args.site, args.jobs, args.force,
+                        args.compress)
+    after = os.times()
+    children_cpu = (after.children_user + after.children_system
+                    - before.children_user - before.children_system)
+
+    if image_derivatives.Image is None:
+        print("Pillow not installed: image derivatives skipped")
+    print(format_timings(stages, children_cpu))
+    print(f"\n{encoding.format_stats()}")
+
+if __name__ == '__main__':
+    main()
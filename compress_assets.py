@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Write precompressed .gz (and .br) siblings of the generated static site
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TEXT_SUFFIXES = {'.html', '.css', '.js', '.json', '.svg', '.xml', '.txt'}
+MANIFEST_NAME = '.compress-manifest.json'
+# Every sibling suffix any installation may write, see codecs()
+SIBLING_SUFFIXES = ('.gz', '.br')
+
+def find_assets(root):
+    """Text assets under root, skipping hidden files and directories"""
+    for path in sorted(Path(root).rglob('*')):
+        relative = path.relative_to(root)
+        if any(part.startswith('.') for part in relative.parts):
+            continue
+        if path.suffix in TEXT_SUFFIXES and path.is_file():
+            yield path
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _replace_sibling(path, suffix, data, original_size):
+    """
+    Write path+suffix if the compressed data is smaller than the original,
+    otherwise remove any stale sibling so the server falls back to it.
+    """
+    sibling = path.with_name(path.name + suffix)
+    if len(data) >= original_size:
+        sibling.unlink(missing_ok=True)
+        return 0
+    tmp = sibling.with_name(f'.{sibling.name}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, sibling)
+    return len(data)
+
+def compress_file(path):
+    """
+    Worker entry point: write the .gz (level 9, no name or mtime in the
+    header, so output is reproducible) and, when the brotli module is
+    installed, the .br (quality 11) of one file. Siblings of codecs this
+    installation lacks are removed, so none is left behind with the
+    content of an older version of the file.
+
+    Returns (path, original size, compressed sizes by suffix).
+    """
+    path = Path(path)
+    data = path.read_bytes()
+    sizes = {'.gz': _replace_sibling(path, '.gz', gzip.compress(data, 9, mtime=0), len(data))}
+    if brotli is not None:
+        sizes['.br'] = _replace_sibling(path, '.br', brotli.compress(data, quality=11), len(data))
+    for suffix in SIBLING_SUFFIXES:
+        if suffix not in sizes:
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+    return str(path), len(data), sizes
+
+def codecs():
+    """Suffixes of the siblings this installation can write"""
+    return ['.gz'] if brotli is None else ['.gz', '.br']
+
+def load_manifest(path):
+    """(codecs, {relative path: [source digest, sibling suffixes]}) of the last run"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return [], {}
+    return data['codecs'], data['files']
+
+def compress_assets(root, jobs=1, force=False):
+    """
+    Compress every text asset under root whose content changed since the
+    last run, in a pool of jobs processes.
+
+    Digests of the sources and the siblings written for them are kept in
+    root/.compress-manifest.json, with the codecs used; a file is redone
+    if a sibling went missing, and everything is redone when the codecs
+    change (brotli got installed, say). Siblings of sources that no longer
+    exist are deleted. Returns (compressed, unchanged, removed, bytes
+    before, bytes after) for the files compressed in this run.
+    """
+    root = Path(root)
+    manifest_path = root / MANIFEST_NAME
+    previous_codecs, previous = load_manifest(manifest_path)
+    unchanged_ok = {} if force or previous_codecs != codecs() else previous
+
+    current = {}
+    todo = []
+    for path in find_assets(root):
+        relative = path.relative_to(root).as_posix()
+        digest = file_digest(path)
+        entry = unchanged_ok.get(relative)
+        # Siblings are only written when compression pays off, so the
+        # manifest says which ones to expect
+        if (entry is not None and entry[0] == digest
+                and all(path.with_name(path.name + suffix).exists() for suffix in entry[1])):
+            current[relative] = entry
+            continue
+        current[relative] = [digest, []]
+        todo.append(path)
+
+    removed = 0
+    for relative in previous:
+        if relative not in current:
+            for suffix in SIBLING_SUFFIXES:
+                sibling = root / (relative + suffix)
+                if sibling.exists():
+                    sibling.unlink()
+                    removed += 1
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        results = [compress_file(path) for path in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(compress_file, todo, chunksize=16))
+
+    before = after = 0
+    for path, size, sizes in results:
+        current[Path(path).relative_to(root).as_posix()][1] = [
+            suffix for suffix, compressed in sizes.items() if compressed]
+        before += size
+        after += min([size] + [s for s in sizes.values() if s])
+
+    tmp = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'codecs': codecs(), 'files': current}, f, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+
+    return len(todo), len(current) - len(todo), removed, before, after
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('root', nargs='?', default='newsite',
+                        help='directory of the static site (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='worker processes (0 = one per CPU, default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='recompress every asset, changed or not')
+    args = parser.parse_args()
+
+    compressed, unchanged, removed, before, after = compress_assets(
+        args.root, args.jobs, args.force)
+
+    print(f"Compressed {compressed} assets to {' and '.join(codecs())} "
+          f"({unchanged} unchanged, {removed} stale siblings removed)")
+    if compressed:
+        print(f"  {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+              f"({after / before * 100:.1f}% with the best sibling)")
+    if brotli is None:
+        print("  brotli module not installed: .br siblings skipped")
+
+if __name__ == '__main__':
+    main()
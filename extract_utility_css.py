@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Build the static utility stylesheet of the newsite from the classes its pages use
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+# Theme: Tailwind's defaults for what the site uses, plus the archi-* colors
+# the pages used to configure inline for the CDN
+COLORS = {
+    'white': (255, 255, 255),
+    'black': (0, 0, 0),
+    'archi-pink': (0xe9, 0x1e, 0x63),
+    'archi-purple': (0x9c, 0x27, 0xb0),
+    'archi-deep-purple': (0x67, 0x3a, 0xb7),
+    'archi-violet': (0x7b, 0x2c, 0xbf),
+}
+SCREENS = {'sm': 640, 'md': 768, 'lg': 1024, 'xl': 1280, '2xl': 1536}
+FONT_SIZES = {
+    'xs': ('0.75rem', '1rem'),
+    'sm': ('0.875rem', '1.25rem'),
+    'base': ('1rem', '1.5rem'),
+    'lg': ('1.125rem', '1.75rem'),
+    'xl': ('1.25rem', '1.75rem'),
+    '2xl': ('1.5rem', '2rem'),
+    '3xl': ('1.875rem', '2.25rem'),
+    '4xl': ('2.25rem', '2.5rem'),
+    '5xl': ('3rem', '1'),
+    '6xl': ('3.75rem', '1'),
+}
+FONT_WEIGHTS = {'normal': 400, 'medium': 500, 'semibold': 600, 'bold': 700, 'extrabold': 800}
+RADII = {'': '0.25rem', 'sm': '0.125rem', 'md': '0.375rem', 'lg': '0.5rem',
+         'xl': '0.75rem', '2xl': '1rem', '3xl': '1.5rem', 'full': '9999px'}
+MAX_WIDTHS = {'none': 'none', 'xs': '20rem', 'sm': '24rem', 'md': '28rem', 'lg': '32rem',
+              'xl': '36rem', '2xl': '42rem', '3xl': '48rem', '4xl': '56rem',
+              '5xl': '64rem', '6xl': '72rem', '7xl': '80rem', 'full': '100%'}
+BLURS = {'sm': '4px', '': '8px', 'md': '12px', 'lg': '16px', 'xl': '24px'}
+DIRECTIONS = {'t': 'top', 'tr': 'top right', 'r': 'right', 'br': 'bottom right',
+              'b': 'bottom', 'bl': 'bottom left', 'l': 'left', 'tl': 'top left'}
+LEADINGS = {'none': '1', 'tight': '1.25', 'snug': '1.375', 'normal': '1.5',
+            'relaxed': '1.625', 'loose': '2'}
+SPACING_SIDES = {
+    '': ('{}',),
+    'x': ('{}-left', '{}-right'),
+    'y': ('{}-top', '{}-bottom'),
+    't': ('{}-top',),
+    'r': ('{}-right',),
+    'b': ('{}-bottom',),
+    'l': ('{}-left',),
+}
+
+# The part of Tailwind's Preflight reset the pages rely on, which the CDN
+# script used to inject
+PREFLIGHT = (
+    '*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb}'
+    'html{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:ui-sans-serif,'
+    'system-ui,sans-serif,"Apple Color Emoji","Segoe UI Emoji","Segoe UI Symbol","Noto Color Emoji"}'
+    'body{margin:0;line-height:inherit}'
+    'hr{height:0;color:inherit;border-top-width:1px}'
+    'h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}'
+    'a{color:inherit;text-decoration:inherit}'
+    'b,strong{font-weight:bolder}'
+    'code,kbd,samp,pre{font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,monospace;font-size:1em}'
+    'small{font-size:80%}'
+    'table{text-indent:0;border-color:inherit;border-collapse:collapse}'
+    'button,input,optgroup,select,textarea{font-family:inherit;font-size:100%;font-weight:inherit;'
+    'line-height:inherit;color:inherit;margin:0;padding:0}'
+    'button,[type=button],[type=reset],[type=submit]{-webkit-appearance:button;'
+    'background-color:transparent;background-image:none}'
+    '[type=search]{-webkit-appearance:textfield;outline-offset:-2px}'
+    'blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}'
+    'ol,ul,menu{list-style:none;margin:0;padding:0}'
+    'input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}'
+    'button,[role=button]{cursor:pointer}'
+    'img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}'
+    'img,video{max-width:100%;height:auto}'
+    '[hidden]{display:none}'
+)
+
+# Utilities without a value
+STATIC = {
+    'block': 'display:block',
+    'inline-block': 'display:inline-block',
+    'flex': 'display:flex',
+    'grid': 'display:grid',
+    'hidden': 'display:none',
+    'fixed': 'position:fixed',
+    'absolute': 'position:absolute',
+    'relative': 'position:relative',
+    'inset-0': 'inset:0px',
+    'flex-1': 'flex:1 1 0%',
+    'flex-row': 'flex-direction:row',
+    'flex-col': 'flex-direction:column',
+    'flex-wrap': 'flex-wrap:wrap',
+    'items-center': 'align-items:center',
+    'items-start': 'align-items:flex-start',
+    'justify-center': 'justify-content:center',
+    'justify-between': 'justify-content:space-between',
+    'mx-auto': 'margin-left:auto;margin-right:auto',
+    'w-full': 'width:100%',
+    'h-full': 'height:100%',
+    'min-h-screen': 'min-height:100vh',
+    'text-left': 'text-align:left',
+    'text-center': 'text-align:center',
+    'bg-cover': 'background-size:cover',
+    'bg-center': 'background-position:center',
+    'bg-fixed': 'background-attachment:fixed',
+    'border': 'border-width:1px',
+    'border-t': 'border-top-width:1px',
+    'border-b': 'border-bottom-width:1px',
+    'outline-none': 'outline:2px solid transparent;outline-offset:2px',
+    'cursor-pointer': 'cursor:pointer',
+    'underline': 'text-decoration-line:underline',
+    'transition': ('transition-property:color,background-color,border-color,'
+                   'text-decoration-color,fill,stroke,opacity,box-shadow,transform,'
+                   'filter,backdrop-filter;transition-timing-function:cubic-bezier(0.4,0,0.2,1);'
+                   'transition-duration:150ms'),
+}
+
+def spacing(value):
+    """Tailwind spacing scale: 4 -> 1rem, px -> 1px"""
+    if value == 'px':
+        return '1px'
+    if value == '0':
+        return '0px'
+    return f'{float(value) * 0.25:g}rem'
+
+def color(name):
+    """'white/60' -> 'rgb(255 255 255 / 0.6)'; None if not a theme color"""
+    name, _, opacity = name.partition('/')
+    if name not in COLORS or (opacity and not opacity.isdigit()):
+        return None
+    r, g, b = COLORS[name]
+    if opacity:
+        return f'rgb({r} {g} {b} / {int(opacity) / 100:g})'
+    return f'rgb({r} {g} {b})'
+
+def transparent(name):
+    """The color of a theme color name at zero opacity, for gradient ends"""
+    r, g, b = COLORS[name.partition('/')[0]]
+    return f'rgb({r} {g} {b} / 0)'
+
+def _spacing_rule(prefix):
+    def resolve(match):
+        sides, value = match.group(1), match.group(2)
+        properties = SPACING_SIDES[sides]
+        return '{}', ';'.join(f'{p.format(prefix)}:{spacing(value)}' for p in properties)
+    return resolve
+
+def _text(match):
+    value = match.group(1)
+    if value in FONT_SIZES:
+        size, height = FONT_SIZES[value]
+        return '{}', f'font-size:{size};line-height:{height}'
+    value = color(value)
+    return value and ('{}', f'color:{value}')
+
+def _colored(template, prop):
+    def resolve(match):
+        value = color(match.group(1))
+        return value and (template, f'{prop}:{value}')
+    return resolve
+
+def _gradient(kind):
+    def resolve(match):
+        value = color(match.group(1))
+        if value is None:
+            return None
+        if kind == 'from':
+            return '{}', (f'--tw-gradient-from:{value};--tw-gradient-to:{transparent(match.group(1))};'
+                          '--tw-gradient-stops:var(--tw-gradient-from),var(--tw-gradient-to)')
+        if kind == 'via':
+            return '{}', (f'--tw-gradient-to:{transparent(match.group(1))};'
+                          f'--tw-gradient-stops:var(--tw-gradient-from),{value},var(--tw-gradient-to)')
+        return '{}', f'--tw-gradient-to:{value}'
+    return resolve
+
+def _lookup(table, template):
+    def resolve(match):
+        value = table.get(match.group(1))
+        return value is not None and ('{}', template.format(value))
+    return resolve
+
+def _size(prop):
+    def resolve(match):
+        value = match.group(1)
+        if value == 'screen':
+            return '{}', f'{prop}:100v{prop[0]}'
+        return '{}', f'{prop}:{spacing(value)}'
+    return resolve
+
+# (regex, resolver): the resolver gets the match and returns (selector
+# template, declarations) or None. The position in the list orders the
+# output like Tailwind does, so that e.g. p-* comes before px-* and from-*
+# before to-*.
+NUMBER = r'(\d+(?:\.5)?|px)'
+RULES = [
+    (re.compile(r'z-(\d+)'), lambda m: ('{}', f'z-index:{m.group(1)}')),
+    (re.compile(r'm()-' + NUMBER), _spacing_rule('margin')),
+    (re.compile(r'm([xy])-' + NUMBER), _spacing_rule('margin')),
+    (re.compile(r'm([trbl])-' + NUMBER), _spacing_rule('margin')),
+    (re.compile(r'h-' + NUMBER.replace('|px', '|px|screen')), _size('height')),
+    (re.compile(r'w-' + NUMBER.replace('|px', '|px|screen')), _size('width')),
+    (re.compile(r'max-w-(\w+)'), _lookup(MAX_WIDTHS, 'max-width:{}')),
+    (re.compile(r'scale-(\d+)'), lambda m: ('{}', f'transform:scale({int(m.group(1)) / 100:g})')),
+    (re.compile(r'grid-cols-(\d+)'),
+     lambda m: ('{}', f'grid-template-columns:repeat({m.group(1)},minmax(0,1fr))')),
+    (re.compile(r'gap-' + NUMBER), lambda m: ('{}', f'gap:{spacing(m.group(1))}')),
+    (re.compile(r'space-y-' + NUMBER),
+     lambda m: ('{}>:not([hidden])~:not([hidden])', f'margin-top:{spacing(m.group(1))}')),
+    (re.compile(r'rounded(?:-(\w+))?'),
+     lambda m: RADII.get(m.group(1) or '') and ('{}', f'border-radius:{RADII[m.group(1) or ""]}')),
+    (re.compile(r'border-([\w-]+/?\d*)'), _colored('{}', 'border-color')),
+    (re.compile(r'bg-([\w-]+/?\d*)'), _colored('{}', 'background-color')),
+    (re.compile(r'bg-gradient-to-(\w+)'),
+     lambda m: DIRECTIONS.get(m.group(1)) and (
+         '{}', f'background-image:linear-gradient(to {DIRECTIONS[m.group(1)]},var(--tw-gradient-stops))')),
+    (re.compile(r'from-([\w-]+/?\d*)'), _gradient('from')),
+    (re.compile(r'via-([\w-]+/?\d*)'), _gradient('via')),
+    (re.compile(r'to-([\w-]+/?\d*)'), _gradient('to')),
+    (re.compile(r'p()-' + NUMBER), _spacing_rule('padding')),
+    (re.compile(r'p([xy])-' + NUMBER), _spacing_rule('padding')),
+    (re.compile(r'p([trbl])-' + NUMBER), _spacing_rule('padding')),
+    (re.compile(r'text-([\w-]+/?\d*)'), _text),
+    (re.compile(r'font-(\w+)'), _lookup(FONT_WEIGHTS, 'font-weight:{}')),
+    (re.compile(r'leading-(\w+)'), _lookup(LEADINGS, 'line-height:{}')),
+    (re.compile(r'placeholder-([\w-]+/?\d*)'), _colored('{}::placeholder', 'color')),
+    (re.compile(r'backdrop-blur(?:-(\w+))?'),
+     lambda m: BLURS.get(m.group(1) or '') and (
+         '{}', '-webkit-backdrop-filter:blur({0});backdrop-filter:blur({0})'.format(BLURS[m.group(1) or '']))),
+]
+
+PSEUDO_VARIANTS = {'hover': ':hover', 'focus': ':focus'}
+
+def resolve_utility(name):
+    """(rank, selector template, declarations) of a utility without variants, or None"""
+    if name in STATIC:
+        return -1, '{}', STATIC[name]
+    for rank, (pattern, resolver) in enumerate(RULES):
+        match = pattern.fullmatch(name)
+        if match:
+            result = resolver(match)
+            if result:
+                return (rank,) + tuple(result)
+    return None
+
+def escape_class(name):
+    """A class name as a CSS selector"""
+    return '.' + re.sub(r'([^\w-])', r'\\\1', name)
+
+def container_css():
+    """The .container component: full width, capped at each breakpoint"""
+    css = '.container{width:100%}'
+    for width in SCREENS.values():
+        css += f'@media (min-width:{width}px){{.container{{max-width:{width}px}}}}'
+    return css
+
+CLASS_ATTR_RE = re.compile(r'class="([^"]*)"')
+CLASS_LIST_RE = re.compile(r'classList\.(?:add|remove|toggle)\(\s*[\'"]([^\'"]+)[\'"]')
+CSS_CLASS_RE = re.compile(r'\.([A-Za-z_][\w-]*)')
+
+def scan_classes(paths):
+    """Every class named in class="..." attributes or classList calls in the files"""
+    classes = set()
+    for path in paths:
+        text = Path(path).read_text(encoding='utf-8')
+        for match in CLASS_ATTR_RE.finditer(text):
+            classes.update(name for name in match.group(1).split() if '${' not in name)
+        classes.update(CLASS_LIST_RE.findall(text))
+    return classes
+
+def site_sources(root):
+    """The pages and scripts of the site under root whose classes are scanned"""
+    root = Path(root)
+    return sorted(root.glob('*.html')) + sorted(root.glob('articles/*.html')) + sorted(root.glob('js/*.js'))
+
+def build_stylesheet(classes):
+    """
+    Minified CSS for the used classes: Preflight, the container, plain
+    utilities, then hover/focus variants, then one media block per
+    breakpoint. Returns (css, classes that are not utilities).
+    """
+    plain, variants, responsive = [], [], {screen: [] for screen in SCREENS}
+    unknown = set()
+    container = False
+
+    for name in classes:
+        *prefixes, utility = name.split(':')
+        if utility == 'container' and not prefixes:
+            container = True
+            continue
+        resolved = resolve_utility(utility)
+        if resolved is None or any(p not in PSEUDO_VARIANTS and p not in SCREENS for p in prefixes):
+            unknown.add(name)
+            continue
+
+        rank, template, declarations = resolved
+        pseudo = ''.join(PSEUDO_VARIANTS[p] for p in prefixes if p in PSEUDO_VARIANTS)
+        screens = [p for p in prefixes if p in SCREENS]
+        rule = (rank, name, template.format(escape_class(name) + pseudo) + '{' + declarations + '}')
+        if screens:
+            responsive[screens[0]].append(rule)
+        elif pseudo:
+            variants.append(rule)
+        else:
+            plain.append(rule)
+
+    css = PREFLIGHT + (container_css() if container else '')
+    css += ''.join(rule for _, _, rule in sorted(plain))
+    css += ''.join(rule for _, _, rule in sorted(variants))
+    for screen, rules in responsive.items():
+        if rules:
+            css += (f'@media (min-width:{SCREENS[screen]}px){{'
+                    + ''.join(rule for _, _, rule in sorted(rules)) + '}')
+    return css + '\n', unknown
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('root', nargs='?', default='newsite',
+                        help='directory of the static site (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='css/utilities.css',
+                        help='stylesheet to write, relative to root (default: %(default)s)')
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    sources = site_sources(root)
+    css, unknown = build_stylesheet(scan_classes(sources))
+
+    output = root / args.output
+    output.write_text(css, encoding='utf-8')
+
+    # Classes the site stylesheets define are not expected to be utilities
+    custom = set()
+    for path in root.glob('css/*.css'):
+        if path != output:
+            custom.update(CSS_CLASS_RE.findall(path.read_text(encoding='utf-8')))
+    unused = sorted(unknown - custom)
+
+    print(f"Scanned {len(sources)} files, wrote {output} ({len(css) / 1024:.1f} KB)")
+    if unused:
+        print(f"  no utility or style.css rule for: {' '.join(unused)}")
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,490 @@ Fix encoding issues in text - convert everything to proper UTF-8
 """
 
 import html
+import io
+import mmap
+import os
 import re
+import unicodedata
+from collections import OrderedDict
+
+# Common mojibake (double-encoded UTF-8) and their fixes.
+# Order matters! More specific/longer patterns first: the table is applied
+# as if each pair were a separate text.replace() in this order.
+REPLACEMENTS = [
+    # Common Italian words (most specific first)
+    ('piÃ¹', 'più'),
+    ('perchÃ©', 'perché'),
+    ('sarÃ ', 'sarà'),
+    ('sarÃ', 'sarà'),  # without space
+    ('verrÃ ', 'verrà'),
+    ('verrÃ', 'verrà'),  # without space
+    ('lÃ¬', 'lì'),
+    ('cosÃ¬', 'così'),
+    ('giÃ ', 'già'),
+    ('giÃ', 'già'),  # without space
+    ('quÃ¬', 'qui'),
+    ('qualitÃ ', 'qualità'),
+    ('qualitÃ', 'qualità'),  # without space
+    ('cittÃ ', 'città'),
+    ('cittÃ', 'città'),  # without space
+    ('universitÃ ', 'università'),
+    ('universitÃ', 'università'),  # without space
+    ('novitÃ ', 'novità'),
+    ('novitÃ', 'novità'),  # without space
+    ('possibilitÃ ', 'possibilità'),
+    ('possibilitÃ', 'possibilità'),  # without space
+    ('attivitÃ ', 'attività'),
+    ('attivitÃ', 'attività'),  # without space
+    ('identitÃ ', 'identità'),
+    ('identitÃ', 'identità'),  # without space
+    ('libertÃ ', 'libertà'),
+    ('libertÃ', 'libertà'),  # without space
+    ('capacitÃ ', 'capacità'),
+    ('capacitÃ', 'capacità'),  # without space
+    ('visibilitÃ ', 'visibilità'),
+    ('visibilitÃ', 'visibilità'),  # without space
+    ('facoltÃ ', 'facoltà'),
+    ('facoltÃ', 'facoltà'),  # without space
+    ('originalitÃ ', 'originalità'),
+    ('originalitÃ', 'originalità'),  # without space
+    ('capillaritÃ ', 'capillarità'),
+    ('capillaritÃ', 'capillarità'),  # without space
+
+    # Special apostrophe combinations (before individual characters)
+    ("câ€™Ã¨", "c'è"),
+    ("lâ€™Ã¨", "l'è"),
+    ("câ€™", "c'"),
+    ("lâ€™", "l'"),
+    ("dellâ€™", "dell'"),
+    ("allâ€™", "all'"),
+    ("sullâ€™", "sull'"),
+    ("unâ€™", "un'"),
+    ("nellâ€™", "nell'"),
+    ("quellâ€™", "quell'"),
+    ("dâ€™", "d'"),
+    ("tuttiâ€™", "tutti'"),
+    ("alâ€™", "al'"),
+    ("dall'", "dall'"),
+
+    # Quotes and apostrophes (smart quotes broken)
+    ('â€™', "'"),
+    ('â€˜', "'"),
+    ('â€œ', '"'),
+    ('â€\x9d', '"'),  # cp1252 has no 0x9d, so it often survives as a control char
+    ('â€', '"'),
+    ('â€"', '—'),  # em dash
+    ('â€"', '–'),  # en dash
+    ('‚', ','),
+    ('„', '"'),
+    ('…', '...'),
+
+    # Common Italian characters (individual)
+    ('Ã¨', 'è'),
+    ('Ã©', 'é'),
+    ('Ãˆ', 'È'),
+    ('Ã‰', 'É'),
+    ('Ã ', 'à'),
+    ('Ã¡', 'á'),
+    ('Ã€', 'À'),
+    ('Ã¬', 'ì'),
+    ('Ã­', 'í'),
+    ('ÃŒ', 'Ì'),
+    ('Ã²', 'ò'),
+    ('Ã³', 'ó'),
+    ('Ã¹', 'ù'),
+    ('Ãº', 'ú'),
+    ('Ã™', 'Ù'),
+    ('Ãš', 'Ú'),
+    ('Ã§', 'ç'),
+    ('Ã‡', 'Ç'),
+
+    # Non-breaking space and other special spaces
+    ('Â ', ' '),
+    ('Â', ''),
+    ('\xa0', ' '),
+
+    # Encoding artifacts
+    ('Ã‚', ''),
+    ('â€ž', '"'),
+    ('â€¦', '...'),
+    ('â‚¬', '€'),
+]
+
+# Characters that (almost) only occur in mojibake. Each compiled key is
+# anchored on the first of these it contains, so the regex engine can skip
+# ahead to them instead of trying every key at every position.
+ANCHOR_CHARS = 'ÃâÂ\xa0‚„…'
+
+def _overlap_offsets(first, second):
+    """Yield each offset from the start of `first` at which `second` can overlap it"""
+    for offset in range(1 - len(second), len(first)):
+        start, end = max(0, offset), min(len(first), offset + len(second))
+        if first[start:end] == second[start - offset:end - offset]:
+            yield offset
+
+def _anchor(old, new):
+    """Index of the anchor character in `old`, or 0 if the key cannot be anchored"""
+    for i, char in enumerate(old):
+        if char in ANCHOR_CHARS:
+            # The text before the anchor is only looked at, never replaced, so
+            # it must come through unchanged and must not be part of an
+            # earlier match of the same key
+            if not new.startswith(old[:i]):
+                return 0
+            if any(offset + i >= len(old)
+                   for offset in _overlap_offsets(old, old) if offset > 0):
+                return 0
+            return i
+    return 0
+
+def _can_create(new, key):
+    """True if inserting `new` into some text can produce a new match of `key`"""
+    if not new:
+        # Deleting text joins its neighbours together
+        return len(key) > 1
+    if new in key or key in new:
+        return True
+    return any(key.startswith(new[i:]) or key.endswith(new[:i])
+               for i in range(1, len(new)))
+
+def _conflicts(earlier, later):
+    """True if two table entries cannot be applied in the same regex pass"""
+    (old, new, anchor), (later_old, _, later_anchor) = earlier, later
+
+    # `earlier`'s replacement could produce a match for `later`
+    if _can_create(new, later_old):
+        return True
+
+    # Wherever the two keys overlap, the regex must reach `earlier`'s anchor
+    # first (or both at once, where table order wins) and `later` must then
+    # fall inside the text `earlier` consumed, exactly as if `earlier` had
+    # been replaced everywhere before `later` was looked for.
+    return any(not anchor <= offset + later_anchor < len(old)
+               for offset in _overlap_offsets(old, later_old))
+
+def compile_replacements(replacements):
+    """
+    Compile an ordered replacement table into as few regex passes as possible.
+
+    Consecutive pairs are grouped as long as one leftmost scan gives the same
+    result as replacing them one after another; each group becomes a single
+    alternation in table order. Returns a list of (pattern, repl) for
+    pattern.sub(repl, text).
+    """
+    groups = []
+    group = []
+
+    for old, new in replacements:
+        # Identity pairs never change the text
+        if old == new:
+            continue
+
+        entry = (old, new, _anchor(old, new))
+        if any(_conflicts(earlier, entry) for earlier in group):
+            groups.append(group)
+            group = []
+
+        # A key starting with an earlier key of the same pass can never match
+        # (this also drops keys repeated within a pass)
+        if not any(old.startswith(earlier[0]) for earlier in group):
+            group.append(entry)
+
+    if group:
+        groups.append(group)
+
+    compiled = []
+    for group in groups:
+        # Alternatives are bucketed by their first character, so every branch
+        # of the final pattern starts with a literal the regex engine can
+        # search for. Each one captures its tail; the group number picks the
+        # replacement.
+        buckets = {}
+        outputs = [None]
+        for old, new, anchor in group:
+            lookbehind = f'(?<={re.escape(old[:anchor + 1])})' if anchor else ''
+            buckets.setdefault(old[anchor], []).append(
+                f'{lookbehind}({re.escape(old[anchor + 1:])})')
+            outputs.append(new[anchor:])
+
+        pattern = re.compile('|'.join(
+            re.escape(char) + '(?:' + '|'.join(alternatives) + ')'
+            for char, alternatives in buckets.items()))
+        compiled.append((pattern, lambda match, outputs=outputs: outputs[match.lastindex]))
+
+    return compiled
+
+_COMPILED_REPLACEMENTS = compile_replacements(REPLACEMENTS)
+
+# cp1252 characters for the bytes 0x80-0x9f. The five bytes cp1252 leaves
+# undefined usually survive as latin-1 control characters instead.
+_CP1252_C1 = {bytes([byte]).decode('cp1252'): byte
+              for byte in range(0x80, 0xA0) if byte not in (0x81, 0x8D, 0x8F, 0x90, 0x9D)}
+
+# Misread character -> the latin-1 character with the original byte value
+_TO_BYTES = {ord(char): byte for char, byte in _CP1252_C1.items()}
+
+# A double-encoded UTF-8 sequence: a lead byte and its continuation bytes,
+# each shown as the character cp1252/latin-1 decoded it to. Only the leads
+# that Italian, French and typographic text actually produce are accepted:
+# Â and Ã (U+0080-U+00FF), Å (œ, Œ and friends) and â (quotes, dashes, €).
+# Any other accented capital before a symbol is far more likely to be
+# correct text ('È»', 'Ù«') than mojibake. The pattern starts with a plain
+# character class so the regex engine can skip ahead.
+_CONTINUATION = '[\\x80-\\xbf' + re.escape(''.join(_CP1252_C1)) + ']'
+MOJIBAKE_SEQUENCE = (
+    '[\\xc2\\xc3\\xc5\\xe2]'
+    f'(?:(?<=[\\xc2\\xc3\\xc5]){_CONTINUATION}'
+    f'|(?<=\\xe2){_CONTINUATION}{{2}})'
+)
+_MOJIBAKE_RUN = re.compile(f'{MOJIBAKE_SEQUENCE}(?:{MOJIBAKE_SEQUENCE})*')
+_MOJIBAKE_SEQUENCE = re.compile(MOJIBAKE_SEQUENCE)
+
+# Original byte -> the character cp1252 (or latin-1, where cp1252 has a
+# hole) shows it as, the inverse of _TO_BYTES
+_FROM_BYTES = {byte: char for char, byte in _CP1252_C1.items()}
+
+# Letters cp1252 and latin-1 only have as symbols: right after an accented
+# letter they are as suspicious as punctuation
+_ODD_LETTERS = {char for char in _CP1252_C1 if char.isalpha()} | set('ªºµ')
+
+def _undo_double_encoding(text):
+    """Re-decode a run of mojibake as UTF-8; raises UnicodeDecodeError if it is not one"""
+    return text.translate(_TO_BYTES).encode('latin-1').decode('utf-8')
+
+def _redo_double_encoding(text):
+    """Double-encode text the way _undo_double_encoding() expects to find it"""
+    return text.encode('utf-8').decode('latin-1').translate(_FROM_BYTES)
+
+def _badness(text):
+    """
+    Count what makes text look like mojibake: control, unassigned and
+    private-use characters, and accented letters directly followed by a
+    non-ASCII symbol, space or one of _ODD_LETTERS.
+    """
+    bad = 0
+    previous = ''
+    for char in text:
+        if unicodedata.category(char) in ('Cc', 'Cn', 'Co', 'Cs'):
+            bad += 1
+        elif (previous >= '\xc0' and previous.isalpha() and char >= '\x80'
+              and (not char.isalpha() or char in _ODD_LETTERS)):
+            bad += 1
+        previous = char
+    return bad
+
+def _repair_run(run):
+    """
+    The text a run of mojibake was made from, or None if the run is not
+    double-encoded UTF-8 (it must decode and encode back to itself) or does
+    not read any better decoded.
+    """
+    try:
+        decoded = _undo_double_encoding(run)
+    except UnicodeDecodeError:
+        return None
+    if _redo_double_encoding(decoded) != run or _badness(decoded) >= _badness(run):
+        return None
+    return decoded
+
+def _decoded_overrides(replacements):
+    """
+    Where the table repairs a single mojibake sequence to something other
+    than the decoded character (curly quotes to straight ones, '…' to
+    '...'), apply the same choice to the output of the generic decoder.
+    """
+    overrides = {}
+    for old, new in replacements:
+        if not _MOJIBAKE_SEQUENCE.fullmatch(old):
+            continue
+        try:
+            decoded = _undo_double_encoding(old)
+        except UnicodeDecodeError:
+            continue
+        if decoded != new:
+            overrides.setdefault(ord(decoded), new)
+    return overrides
+
+_DECODED_OVERRIDES = _decoded_overrides(REPLACEMENTS)
+
+def _decode_sequence(match):
+    fixed = _repair_run(match.group())
+    return match.group() if fixed is None else fixed.translate(_DECODED_OVERRIDES)
+
+def _decode_run(match):
+    fixed = _repair_run(match.group())
+    if fixed is None:
+        # Only part of the run is mojibake: go one sequence at a time
+        return _MOJIBAKE_SEQUENCE.sub(_decode_sequence, match.group())
+    return fixed.translate(_DECODED_OVERRIDES)
+
+def decode_mojibake(text):
+    """
+    Repair every run of double-encoded UTF-8 in text.
+
+    Each run of characters that reads as UTF-8 bytes misdecoded through
+    cp1252/latin-1 is turned back into bytes and decoded once, so any
+    accented letter or symbol is fixed, not only those in REPLACEMENTS.
+    A run is only replaced if it round-trips exactly and the result looks
+    more like real text than the run did (see _badness()), so correct
+    text such as 'È»' is left alone.
+    """
+    return _MOJIBAKE_RUN.sub(_decode_run, text)
+
+# The same sequences in the raw UTF-8 of a file: every misread character is
+# itself UTF-8 encoded, so the leads Â, Ã, Å and â are C3 82, C3 83, C3 85
+# and C3 A2, and each continuation byte is C2 80-C2 BF or the UTF-8 of its
+# cp1252 character. All alternatives start with the literal C3, which the
+# regex engine scans for directly.
+_CONTINUATION_BYTES = (rb'(?:\xc2[\x80-\xbf]|'
+                       + b'|'.join(re.escape(char.encode('utf-8')) for char in _CP1252_C1)
+                       + b')')
+MOJIBAKE_BYTES = (
+    rb'\xc3(?:[\x82\x83\x85]' + _CONTINUATION_BYTES
+    + rb'|\xa2' + _CONTINUATION_BYTES + rb'{2})'
+)
+_MOJIBAKE_BYTES_RUN = re.compile(rb'(?:' + MOJIBAKE_BYTES + rb')+')
+_MOJIBAKE_BYTES_SEQUENCE = re.compile(MOJIBAKE_BYTES)
+
+def _repair_bytes_sequence(match):
+    fixed = _repair_run(match.group().decode('utf-8'))
+    return match.group() if fixed is None else fixed.encode('utf-8')
+
+def _repair_bytes_run(run):
+    """The original UTF-8 of a run of double-encoded bytes, or the run itself"""
+    fixed = _repair_run(run.decode('utf-8'))
+    if fixed is None:
+        return _MOJIBAKE_BYTES_SEQUENCE.sub(_repair_bytes_sequence, run)
+    return fixed.encode('utf-8')
+
+def repair_mojibake_bytes(buffer, out):
+    """
+    Copy buffer to the binary file out, repairing double-encoded UTF-8.
+
+    One linear pass: the bytes between runs are written straight from the
+    buffer (which may be an mmap), and each run is replaced by the bytes it
+    was made from. Runs are accepted on the same terms as in
+    decode_mojibake(), so valid UTF-8 such as 'È\xa0' or 'É»' is copied
+    as is. Unlike decode_mojibake() no characters are swapped for
+    ASCII, so markup and attribute quoting are never touched; fix_encoding()
+    still normalises the text afterwards. Returns the number of runs repaired.
+    """
+    repaired = 0
+    position = 0
+    with memoryview(buffer) as view:
+        for match in _MOJIBAKE_BYTES_RUN.finditer(buffer):
+            run = match.group()
+            fixed = _repair_bytes_run(run)
+            if fixed == run:
+                continue
+            out.write(view[position:match.start()])
+            out.write(fixed)
+            position = match.end()
+            repaired += 1
+        out.write(view[position:])
+    return repaired
+
+def repair_file(path, out):
+    """Memory-map the file at path and write its repaired bytes to out, see repair_mojibake_bytes()"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0  # mmap refuses empty files
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return repair_mojibake_bytes(buffer, out)
+
+def needs_repair_pattern(replacements):
+    """
+    Compile a pattern that finds anything html.unescape(), decode_mojibake()
+    or the table could change.
+
+    Every key is represented by its first ANCHOR_CHARS character (any text
+    containing the key contains it); single-character keys join the same
+    class and longer keys without an anchor are matched literally.
+    Text with no match is left untouched by all three steps.
+    """
+    chars = {'&'}
+    literals = []
+    for old, new in replacements:
+        if old == new:
+            continue
+        anchors = [char for char in old if char in ANCHOR_CHARS]
+        if anchors:
+            chars.add(anchors[0])
+        elif len(old) == 1:
+            chars.add(old)
+        else:
+            literals.append(re.escape(old))
+
+    char_class = '[' + ''.join(re.escape(char) for char in sorted(chars)) + ']'
+    return re.compile('|'.join([char_class, MOJIBAKE_SEQUENCE] + literals))
+
+_NEEDS_REPAIR = needs_repair_pattern(REPLACEMENTS)
+
+# Call counters, see get_stats()
+_stats = {
+    'calls': 0,
+    'fast_path': 0,
+    'cache_hits': 0,
+    'cache_misses': 0,
+    'cache_evictions': 0,
+}
+
+# Optional LRU cache of short strings, see enable_cache()
+_cache = None
+_cache_size = 0
+_cache_max_length = 0
+
+def get_stats():
+    """Return a copy of the fix_encoding() counters of this process"""
+    return dict(_stats)
+
+def reset_stats():
+    """Zero the fix_encoding() counters"""
+    for key in _stats:
+        _stats[key] = 0
+
+def merge_stats(stats):
+    """Add counters returned by get_stats() in another process to ours"""
+    for key, value in stats.items():
+        _stats[key] += value
+
+def format_stats(stats=None):
+    """One-line summary of the counters, for build logs"""
+    stats = get_stats() if stats is None else stats
+    calls = stats['calls']
+    fast = stats['fast_path'] / calls * 100 if calls else 0.0
+    line = f"fix_encoding: {calls} calls, {fast:.1f}% took the clean-text fast path"
+
+    lookups = stats['cache_hits'] + stats['cache_misses']
+    if lookups:
+        rate = stats['cache_hits'] / lookups * 100
+        line += (f"; cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses, "
+                 f"{stats['cache_evictions']} evictions ({rate:.1f}% hit rate)")
+    return line
+
+def enable_cache(size=4096, max_length=200):
+    """
+    Put a bounded LRU cache in front of fix_encoding().
+
+    Authors, categories and tags repeat on almost every post, so their
+    repaired form is remembered. Only strings shorter than `max_length`
+    are cached, so one-off post bodies never push them out.
+    """
+    global _cache, _cache_size, _cache_max_length
+    _cache = OrderedDict()
+    _cache_size = size
+    _cache_max_length = max_length
+
+def disable_cache():
+    """Drop the cache and go back to repairing every string"""
+    global _cache
+    _cache = None
+
+def cache_settings():
+    """Return (size, max_length) if the cache is enabled, else None"""
+    if _cache is None:
+        return None
+    return _cache_size, _cache_max_length
 
 def fix_encoding(text):
     """
@@ -13,117 +496,42 @@ def fix_encoding(text):
     if not text:
         return text
 
-    # First, decode HTML entities
-    text = html.unescape(text)
-
-    # Fix common mojibake (double-encoded UTF-8)
-    # Order matters! More specific/longer patterns first
-    replacements = [
-        # Common Italian words (most specific first)
-        ('piÃ¹', 'più'),
-        ('perchÃ©', 'perché'),
-        ('sarÃ ', 'sarà'),
-        ('sarÃ', 'sarà'),  # without space
-        ('verrÃ ', 'verrà'),
-        ('verrÃ', 'verrà'),  # without space
-        ('lÃ¬', 'lì'),
-        ('cosÃ¬', 'così'),
-        ('giÃ ', 'già'),
-        ('giÃ', 'già'),  # without space
-        ('quÃ¬', 'qui'),
-        ('qualitÃ ', 'qualità'),
-        ('qualitÃ', 'qualità'),  # without space
-        ('cittÃ ', 'città'),
-        ('cittÃ', 'città'),  # without space
-        ('universitÃ ', 'università'),
-        ('universitÃ', 'università'),  # without space
-        ('novitÃ ', 'novità'),
-        ('novitÃ', 'novità'),  # without space
-        ('possibilitÃ ', 'possibilità'),
-        ('possibilitÃ', 'possibilità'),  # without space
-        ('attivitÃ ', 'attività'),
-        ('attivitÃ', 'attività'),  # without space
-        ('identitÃ ', 'identità'),
-        ('identitÃ', 'identità'),  # without space
-        ('libertÃ ', 'libertà'),
-        ('libertÃ', 'libertà'),  # without space
-        ('capacitÃ ', 'capacità'),
-        ('capacitÃ', 'capacità'),  # without space
-        ('visibilitÃ ', 'visibilità'),
-        ('visibilitÃ', 'visibilità'),  # without space
-        ('facoltÃ ', 'facoltà'),
-        ('facoltÃ', 'facoltà'),  # without space
-        ('originalitÃ ', 'originalità'),
-        ('originalitÃ', 'originalità'),  # without space
-        ('capillaritÃ ', 'capillarità'),
-        ('capillaritÃ', 'capillarità'),  # without space
-
-        # Special apostrophe combinations (before individual characters)
-        ("câ€™Ã¨", "c'è"),
-        ("lâ€™Ã¨", "l'è"),
-        ("câ€™", "c'"),
-        ("lâ€™", "l'"),
-        ("dellâ€™", "dell'"),
-        ("allâ€™", "all'"),
-        ("sullâ€™", "sull'"),
-        ("unâ€™", "un'"),
-        ("nellâ€™", "nell'"),
-        ("quellâ€™", "quell'"),
-        ("dâ€™", "d'"),
-        ("tuttiâ€™", "tutti'"),
-        ("alâ€™", "al'"),
-        ("dall'", "dall'"),
-
-        # Quotes and apostrophes (smart quotes broken)
-        ('â€™', "'"),
-        ('â€˜', "'"),
-        ('â€œ', '"'),
-        ('â€', '"'),
-        ('â€"', '—'),  # em dash
-        ('â€"', '–'),  # en dash
-        (''', "'"),
-        (''', "'"),
-        ('"', '"'),
-        ('"', '"'),
-        ('‚', ','),
-        ('„', '"'),
-        ('…', '...'),
-
-        # Common Italian characters (individual)
-        ('Ã¨', 'è'),
-        ('Ã©', 'é'),
-        ('Ãˆ', 'È'),
-        ('Ã‰', 'É'),
-        ('Ã ', 'à'),
-        ('Ã¡', 'á'),
-        ('Ã€', 'À'),
-        ('Ã¬', 'ì'),
-        ('Ã­', 'í'),
-        ('ÃŒ', 'Ì'),
-        ('Ã²', 'ò'),
-        ('Ã³', 'ó'),
-        ('Ã¹', 'ù'),
-        ('Ãº', 'ú'),
-        ('Ã™', 'Ù'),
-        ('Ãš', 'Ú'),
-        ('Ã§', 'ç'),
-        ('Ã‡', 'Ç'),
-
-        # Non-breaking space and other special spaces
-        ('Â ', ' '),
-        ('Â', ''),
-        ('\xa0', ' '),
-
-        # Encoding artifacts
-        ('Ã‚', ''),
-        ('â€ž', '"'),
-        ('â€¦', '...'),
-        ('â‚¬', '€'),
-    ]
-
-    # Apply replacements in order
-    for old, new in replacements:
-        text = text.replace(old, new)
+    if _cache is None or len(text) >= _cache_max_length:
+        return _fix_encoding(text)
+
+    fixed = _cache.get(text)
+    if fixed is not None:
+        _cache.move_to_end(text)
+        _stats['cache_hits'] += 1
+        return fixed
+
+    _stats['cache_misses'] += 1
+    fixed = _cache[text] = _fix_encoding(text)
+    if len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+        _stats['cache_evictions'] += 1
+    return fixed
+
+def _fix_encoding(text):
+    """fix_encoding() without the cache"""
+    _stats['calls'] += 1
+
+    # Most strings are already clean: skip straight to whitespace clean-up
+    if _NEEDS_REPAIR.search(text) is None:
+        _stats['fast_path'] += 1
+    else:
+        # Re-decode double-encoded UTF-8 wherever it is well formed. This
+        # comes before unescaping, so characters written as entities are
+        # never merged into a sequence with their neighbours.
+        text = decode_mojibake(text)
+
+        # Then decode HTML entities
+        text = html.unescape(text)
+
+        # Then the fixed table, for mojibake that lost bytes on the way
+        # (e.g. 'Ã' + plain space) and for spelling fixes, see REPLACEMENTS
+        for pattern, repl in _COMPILED_REPLACEMENTS:
+            text = pattern.sub(repl, text)
 
     # Clean up multiple spaces
     text = re.sub(r'\s+', ' ', text)
@@ -133,22 +541,30 @@ def fix_encoding(text):
 
     return text.strip()
 
+TEST_CASES = [
+    ("piÃ¹ interessante", "più interessante"),
+    ("câ€™Ã¨ un problema", "c'è un problema"),
+    ("lâ€™autore", "l'autore"),
+    ("VenerdÃ¬ 14 Marzo", "Venerdì 14 Marzo"),
+    ("Ã¨ davvero", "è davvero"),
+    ("perchÃ©", "perché"),
+    ("Ã¶ Ã± Å“ Ã\xa0", "ö ñ œ à"),
+    ("â€” 5 â‚¬ â€œciaoâ€\x9d", '— 5 € "ciao"'),
+    # Entities decode to real curly quotes; only mojibake ones become ASCII
+    ("&#8217;", "’"),
+    ("&nbsp;", " "),
+    # Correct text that merely looks like a lead byte and a continuation
+    ("&Egrave;&nbsp;stato", "È stato"),
+    ("«PERCHÉ»", "«PERCHÉ»"),
+    ("PIÙ»", "PIÙ»"),
+    ("Sì, È“bello”", "Sì, È“bello”"),
+]
+
 def test_fix_encoding():
     """Test the encoding fix function"""
-    test_cases = [
-        ("piÃ¹ interessante", "più interessante"),
-        ("câ€™Ã¨ un problema", "c'è un problema"),
-        ("lâ€™autore", "l'autore"),
-        ("VenerdÃ¬ 14 Marzo", "Venerdì 14 Marzo"),
-        ("Ã¨ davvero", "è davvero"),
-        ("perchÃ©", "perché"),
-        ("&#8217;", "'"),
-        ("&nbsp;", " "),
-    ]
-
     print("Testing encoding fixes:\n")
     all_passed = True
-    for original, expected in test_cases:
+    for original, expected in TEST_CASES:
         result = fix_encoding(original)
         passed = result == expected
         all_passed = all_passed and passed
@@ -158,5 +574,31 @@ def test_fix_encoding():
     print(f"\n{'All tests passed!' if all_passed else 'Some tests failed'}")
     return all_passed
 
+BYTES_TEST_CASES = [
+    ("piÃ¹ câ€™Ã¨ Å“".encode('utf-8'), "più c’è œ".encode('utf-8')),
+    # Valid UTF-8 that must be copied unchanged
+    ("<p>È\xa0stato «PERCHÉ»</p>".encode('utf-8'),
+     "<p>È\xa0stato «PERCHÉ»</p>".encode('utf-8')),
+    ("PIÙ» e PERCHÉ’".encode('utf-8'), "PIÙ» e PERCHÉ’".encode('utf-8')),
+]
+
+def test_repair_mojibake_bytes():
+    """Test the byte-level pre-pass"""
+    print("Testing byte-level repair:\n")
+    all_passed = True
+    for original, expected in BYTES_TEST_CASES:
+        out = io.BytesIO()
+        repair_mojibake_bytes(original, out)
+        result = out.getvalue()
+        passed = result == expected
+        all_passed = all_passed and passed
+        status = "✓" if passed else "✗"
+        print(f"{status} {original!r} → {result!r} (expected: {expected!r})")
+
+    print(f"\n{'All tests passed!' if all_passed else 'Some tests failed'}")
+    return all_passed
+
 if __name__ == '__main__':
     test_fix_encoding()
+    print()
+    test_repair_mojibake_bytes()
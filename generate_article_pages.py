@@ -3,54 +3,38 @@
 Generate individual HTML pages for each article
 """
 
+import argparse
+import hashlib
+import html
 import json
 import os
+import re
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import unquote, urlsplit
+from image_derivatives import MANIFEST_NAME as IMAGE_MANIFEST_NAME, load_image_manifest, srcset
+from parse_wordpress_xml import chunked, read_posts_jsonl
+from profiling import add_profile_argument, profiling
+from templates import Template
 
-def format_date(date_string):
-    """Format date to Italian format"""
+def format_date(date_iso):
+    """Format the ISO 8601 'date_iso' of a post for display"""
     try:
-        date = datetime.strptime(date_string, '%a, %d %b %Y %H:%M:%S %z')
-        return date.strftime('%d %B %Y')
-    except:
-        return date_string
+        return datetime.fromisoformat(date_iso).strftime('%d %B %Y')
+    except ValueError:
+        return date_iso
 
-def create_article_html(article):
-    """Create HTML page for an article"""
-
-    tags_html = ''
-    if article['tags']:
-        tags_html = '<div class="flex flex-wrap gap-2 mt-4">' + ' '.join([
-            f'<span class="badge text-white">{tag}</span>'
-            for tag in article['tags']
-        ]) + '</div>'
-
-    # Content is already cleaned by parse_wordpress_xml.py
-    content = article['content']
-
-    html = f'''<!DOCTYPE html>
+ARTICLE_TEMPLATE = Template('''<!DOCTYPE html>
 <html lang="it">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{article['title']} - Biblioteca Archimedica</title>
-    <script src="https://cdn.tailwindcss.com"></script>
+    <title>{{title}} - Biblioteca Archimedica</title>
     <link rel="stylesheet" href="../css/style.css">
-    <script>
-        tailwind.config = {{
-            theme: {{
-                extend: {{
-                    colors: {{
-                        'archi-pink': '#e91e63',
-                        'archi-purple': '#9c27b0',
-                        'archi-deep-purple': '#673ab7',
-                        'archi-violet': '#7b2cbf',
-                    }}
-                }}
-            }}
-        }}
-    </script>
+    <link rel="stylesheet" href="../css/utilities.css">
 </head>
 <body class="min-h-screen bg-cover bg-center bg-fixed" style="background-image: url('../images/biblioteca-archimedica.jpg');">
 
@@ -82,33 +66,33 @@ def create_article_html(article):
                 <!-- Article Header -->
                 <div class="mb-8">
                     <div class="flex flex-wrap items-center gap-2 mb-4">
-                        <span class="badge badge-date text-white">{format_date(article['date'])}</span>
+                        <span class="badge badge-date text-white">{{display_date}}</span>
                     </div>
 
                     <h1 class="text-4xl md:text-5xl font-bold text-white mb-6">
-                        {article['title']}
+                        {{title}}
                     </h1>
 
                     <div class="flex items-center text-white/70">
                         <svg class="w-5 h-5 mr-2" fill="currentColor" viewBox="0 0 20 20">
                             <path fill-rule="evenodd" d="M10 9a3 3 0 100-6 3 3 0 000 6zm-7 9a7 7 0 1114 0H3z" clip-rule="evenodd"/>
                         </svg>
-                        <span class="text-lg">di <strong>{article['author']}</strong></span>
+                        <span class="text-lg">di <strong>{{author}}</strong></span>
                     </div>
 
-                    {tags_html}
+                    {{tags_html|raw}}
                 </div>
 
                 <!-- Article Content -->
                 <div class="article-content text-white/90 prose prose-lg prose-invert max-w-none">
-                    {content}
+                    {{content|raw}}
                 </div>
 
                 <!-- Article Footer -->
                 <div class="mt-12 pt-8 border-t border-white/20">
                     <div class="flex flex-col md:flex-row justify-between items-center gap-4">
                         <div class="text-white/60 text-sm">
-                            Pubblicato originariamente su <a href="{article['url']}" target="_blank" class="text-archi-pink hover:text-archi-purple">biblioteca.archimedix.net</a>
+                            Pubblicato originariamente su <a href="{{url|attr}}" target="_blank" class="text-archi-pink hover:text-archi-purple">biblioteca.archimedix.net</a>
                         </div>
                         <a href="../index.html" class="glass-card-article px-6 py-3 rounded-xl text-white font-semibold hover:scale-105 transition">
                             ← Torna agli articoli
@@ -133,33 +117,347 @@ def create_article_html(article):
 
 </body>
 </html>
-'''
+''')
+
+TAGS_TEMPLATE = Template('<div class="flex flex-wrap gap-2 mt-4">{{tags|raw}}</div>')
+TAG_TEMPLATE = Template('<span class="badge text-white">{{tag}}</span>')
+
+# Hashed with the templates into the page manifest; raise it when the Python
+# side of a page (image rewriting, dates) changes so every page is rebuilt
+RENDER_VERSION = 2
+
+# Local copies of the images of the old site, by order of preference when
+# two of them have the same file name
+IMAGE_DIRS = ('oldwp/wp-content', 'waybiblio/images', 'foto', 'img')
+
+IMG_RE = re.compile(r'<img\b([^>]*?)\s*/?>', re.IGNORECASE)
+ATTR_RE = re.compile(r'''([^\s=/]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?''')
+
+# Attributes of an <img> that are replaced (style: extended) when it is rewritten
+REWRITTEN_ATTRS = {'src', 'srcset', 'sizes', 'width', 'height', 'loading', 'decoding', 'style'}
+
+def image_key(path):
+    """Lookup key of an image path or URL path: its unquoted, lowercased file name"""
+    return unquote(unquote(path.rsplit('/', 1)[-1])).lower()
+
+class ImageIndex:
+    """
+    Local optimized copies of the images of the old site, looked up by file
+    name.
+
+    Built once from the manifest of image_derivatives.py: every source image
+    under one of the directories is indexed by image_key(), so resolving an
+    <img> of an article is a dict lookup, whatever host or Wayback URL it
+    points at. prefix is the path of the derivatives from the pages.
+    """
+
+    def __init__(self, manifest, directories=IMAGE_DIRS, prefix='../images/derived/'):
+        self.formats = manifest['formats']
+        self.prefix = prefix
+        self.by_name = {}
+        for directory in directories:
+            directory = directory.rstrip('/') + '/'
+            for path, digest in sorted(manifest['sources'].items()):
+                if path.startswith(directory):
+                    self.by_name.setdefault(image_key(path), manifest['images'][digest])
+
+    def lookup(self, src):
+        """Manifest entry of the local copy of an image URL, or None"""
+        return self.by_name.get(image_key(urlsplit(html.unescape(src)).path))
+
+    def fingerprint(self):
+        """Hash of the index, so pages are rebuilt when the images change"""
+        encoded = json.dumps([self.formats, self.prefix, self.by_name], sort_keys=True)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def parse_attrs(text):
+    """Attributes of a tag as an ordered {lowercased name: unescaped value}"""
+    attrs = {}
+    for match in ATTR_RE.finditer(text):
+        name, *values = match.groups()
+        value = next((v for v in values if v is not None), '')
+        attrs.setdefault(name.lower(), html.unescape(value))
+    return attrs
+
+def format_attrs(attrs):
+    return ''.join(f' {name}="{html.escape(value, quote=True)}"' for name, value in attrs.items())
+
+def display_size(attrs, entry):
+    """
+    (width, height) an image is shown at: the size given in the post when
+    there is one, completed with the aspect ratio of the image, or its
+    natural size.
+    """
+    width, height = attrs.get('width', ''), attrs.get('height', '')
+    if width.isdigit() and height.isdigit():
+        return int(width), int(height)
+    if width.isdigit():
+        return int(width), round(int(width) * entry['height'] / entry['width'])
+    if height.isdigit():
+        return round(int(height) * entry['width'] / entry['height']), int(height)
+    return entry['width'], entry['height']
+
+def rewrite_image(match, images):
+    """
+    Replacement of one <img> tag: a local copy, with every derivative width
+    in srcset and an AVIF <source> when there is one, or the original
+    reference when the image has no local copy. Both load lazily, and the
+    first has its dimensions so the page does not shift when it arrives,
+    with the blurred placeholder as its background until then.
+    """
+    attrs = parse_attrs(match.group(1))
+    entry = images.lookup(attrs.get('src', '')) if images is not None else None
+    if entry is None or 'webp' not in entry['variants']:
+        attrs.setdefault('loading', 'lazy')
+        attrs.setdefault('decoding', 'async')
+        return f'<img{format_attrs(attrs)}>'
+
+    width, height = display_size(attrs, entry)
+    sizes = f'(max-width: {width}px) 100vw, {width}px'
+    largest = entry['variants']['webp'][-1][1]
+    img = dict(
+        src=images.prefix + largest,
+        srcset=srcset(entry, 'webp', images.prefix),
+        sizes=sizes,
+        width=str(width),
+        height=str(height),
+        **{name: value for name, value in attrs.items() if name not in REWRITTEN_ATTRS},
+        loading='lazy',
+        decoding='async',
+    )
+    style = attrs.get('style', '')
+    if entry.get('placeholder'):
+        style = f"background:url({entry['placeholder']}) center/cover no-repeat;{style}"
+    if style:
+        img['style'] = style
+    tag = f'<img{format_attrs(img)}>'
+    if 'avif' in entry['variants']:
+        source = format_attrs({'type': 'image/avif',
+                               'srcset': srcset(entry, 'avif', images.prefix),
+                               'sizes': sizes})
+        tag = f'<picture><source{source}>{tag}</picture>'
+    return tag
+
+def rewrite_images(content, images):
+    """Rewrite every <img> of an article body with rewrite_image()"""
+    return IMG_RE.sub(lambda match: rewrite_image(match, images), content)
+
+def create_article_html(article, images=None):
+    """
+    Create HTML page for an article; images is the ImageIndex its <img>
+    tags are resolved against
+    """
+
+    tags_html = ''
+    if article['tags']:
+        tags_html = TAGS_TEMPLATE.render(
+            tags=' '.join(TAG_TEMPLATE.render(tag=tag) for tag in article['tags']))
+
+    # Content is already cleaned by parse_wordpress_xml.py
+    return ARTICLE_TEMPLATE.render(
+        title=article['title'],
+        display_date=format_date(article.get('date_iso', '')) or article['date'],
+        author=article['author'],
+        tags_html=tags_html,
+        content=rewrite_images(article['content'], images),
+        url=article['url'],
+    )
+
+def article_slug(article):
+    """Name of the page of an article under articles/, without .html"""
+    return article['slug'] if article['slug'] else article['id']
+
+def load_articles(path):
+    """
+    Iterate over the posts written by parse_wordpress_xml.py: read lazily
+    from JSON Lines, or loaded whole from a compatibility .json export.
+    """
+    if str(path).endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return iter(json.load(f))
+    return read_posts_jsonl(path)
+
+def write_atomic(path, text):
+    """
+    Write text to path through a temporary file in the same directory and
+    a rename, so a reader sees either the old page or the new one, never
+    a partial write.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def write_article_page(articles_dir, article, images=None):
+    """Render one article to articles_dir/<slug>.html; returns the file name"""
+    filename = f"{article_slug(article)}.html"
+    write_atomic(Path(articles_dir) / filename, create_article_html(article, images))
+    return filename
+
+# ImageIndex of a worker process, set once by _init_worker() instead of
+# being pickled with every chunk
+_worker_images = None
+
+def _init_worker(images):
+    global _worker_images
+    _worker_images = images
+
+def _write_chunk(articles_dir, articles, images=None):
+    """Worker entry point: render and write a chunk of articles"""
+    if images is None:
+        images = _worker_images
+    return [write_article_page(articles_dir, article, images) for article in articles]
+
+def iter_write_pages(articles, articles_dir, jobs=1, chunk_size=64, images=None):
+    """
+    Render and write the page of every article, yielding the file names
+    written one chunk at a time, in input order.
+
+    With jobs > 1 the chunks are rendered and written by a pool of worker
+    processes, with only a few chunks per worker in flight (jobs=0 means
+    one per CPU). The image index is sent to each worker once, when it
+    starts.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
 
-    return html
+    if jobs <= 1:
+        for chunk in chunked(articles, chunk_size):
+            yield _write_chunk(articles_dir, chunk, images)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(images,)) as executor:
+        pending = deque()
+        for chunk in chunked(articles, chunk_size):
+            pending.append(executor.submit(_write_chunk, articles_dir, chunk))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def template_version(images=None):
+    """
+    Fingerprint of everything that shapes a page besides its article: the
+    template sources, RENDER_VERSION and the image index. Any change to
+    them rebuilds every page; other edits to the scripts do not.
+    """
+    digest = hashlib.sha256(f'render {RENDER_VERSION}\n'.encode('ascii'))
+    for template in (ARTICLE_TEMPLATE, TAGS_TEMPLATE, TAG_TEMPLATE):
+        digest.update(template.source.encode('utf-8'))
+    if images is not None:
+        digest.update(images.fingerprint().encode('ascii'))
+    return digest.hexdigest()
+
+def article_digest(article):
+    """Hash of the input of one page"""
+    encoded = json.dumps(article, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def load_page_manifest(path):
+    """(template version, {file name: article digest}) of the last run, or (None, {})"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None, {}
+    return data['template'], data['pages']
+
+def save_page_manifest(path, version, pages):
+    write_atomic(path, json.dumps({'template': version, 'pages': pages},
+                                  ensure_ascii=False, indent=1, sort_keys=True))
+
+def remove_stale_pages(articles_dir, previous, pages):
+    """Delete the pages in the previous manifest that are not in pages; returns their names"""
+    removed = [filename for filename in previous if filename not in pages]
+    for filename in removed:
+        (Path(articles_dir) / filename).unlink(missing_ok=True)
+    return removed
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('posts', nargs='?', default='wordpress_posts.jsonl',
+                        help='posts from parse_wordpress_xml.py (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='newsite/articles',
+                        help='directory for the pages (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes for rendering '
+                             '(0 = one per CPU, default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='pages per work unit and per progress line '
+                             '(default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='rewrite every page, even those whose input and '
+                             'template are unchanged')
+    parser.add_argument('--images', default='newsite/images/derived',
+                        help='derivatives from image_derivatives.py that article '
+                             'images are rewritten to (default: %(default)s)')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.output):
+        run(args)
+
+def run(args):
     # Load articles
-    with open('wordpress_posts.json', 'r', encoding='utf-8') as f:
-        articles = json.load(f)
+    articles = load_articles(args.posts)
 
     # Create articles directory
-    articles_dir = Path('newsite/articles')
+    articles_dir = Path(args.output)
     articles_dir.mkdir(exist_ok=True)
 
-    # Generate page for each article
-    for article in articles:
-        slug = article['slug'] if article['slug'] else article['id']
-        filename = f"{slug}.html"
-        filepath = articles_dir / filename
+    # Index of the local copies of article images, built once for all pages
+    images = ImageIndex(load_image_manifest(Path(args.images) / IMAGE_MANIFEST_NAME),
+                        prefix=os.path.relpath(args.images, articles_dir) + '/')
+
+    # Only pages whose article or template changed since the last run are
+    # written; the manifest records what each page was built from
+    manifest_path = articles_dir / '.manifest.json'
+    version = template_version(images)
+    previous_version, previous = load_page_manifest(manifest_path)
+    if args.force or previous_version != version:
+        unchanged_ok = {}
+    else:
+        unchanged_ok = previous
+
+    pages = {}
+    skipped = 0
+
+    def changed_articles():
+        nonlocal skipped
+        for article in articles:
+            filename = f"{article_slug(article)}.html"
+            digest = article_digest(article)
+            pages[filename] = digest
+            if unchanged_ok.get(filename) == digest and (articles_dir / filename).exists():
+                skipped += 1
+                continue
+            yield article
 
-        html = create_article_html(article)
+    # Generate page for each changed article
+    count = 0
+    for filenames in iter_write_pages(changed_articles(), articles_dir, args.jobs,
+                                      args.batch_size, images):
+        count += len(filenames)
+        print(f"  {count} pages written (last: {filenames[-1]})")
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(html)
+    # Remove the pages of posts that are gone
+    removed = remove_stale_pages(articles_dir, previous, pages)
+    for filename in removed:
+        print(f"  removed: {filename}")
 
-        print(f"Created: {filename}")
+    save_page_manifest(manifest_path, version, pages)
 
-    print(f"\nGenerated {len(articles)} article pages in newsite/articles/")
+    print(f"\nGenerated {count} article pages in {articles_dir}/ "
+          f"({skipped} unchanged, {len(removed)} removed)")
 
 if __name__ == '__main__':
     main()
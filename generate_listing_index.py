@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Generate the paged listing index used by the newsite homepage
+"""
+
+import argparse
+import json
+import re
+from pathlib import Path
+from generate_article_pages import article_slug, load_articles
+
+TAG_RE = re.compile(r'<[^>]+>')
+EXCERPT_LENGTH = 200
+
+def plain_excerpt(content, max_length=EXCERPT_LENGTH):
+    """Plain-text excerpt of a post body: tags removed, whitespace collapsed"""
+    text = ' '.join(TAG_RE.sub('', content).split())
+    if len(text) <= max_length:
+        return text
+    return text[:max_length] + '...'
+
+def listing_entry(article):
+    """The fields of a post the homepage card needs, and nothing else"""
+    return {
+        'slug': article_slug(article),
+        'title': article['title'],
+        'timestamp': article['timestamp'],
+        'date_iso': article['date_iso'],
+        'author': article['author'],
+        'tags': article['tags'],
+        'excerpt': plain_excerpt(article['content']),
+    }
+
+def write_page(index_dir, number, entries, total, pages):
+    """Write one shard: the page's entries plus enough to find the next one"""
+    page = {
+        'page': number,
+        'pages': pages,
+        'total': total,
+        'posts': entries,
+    }
+    path = index_dir / f'page-{number}.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(page, f, ensure_ascii=False, separators=(',', ':'))
+    return path
+
+def generate_listing_index(articles, index_dir, page_size=10):
+    """
+    Write the listing entries of articles (already in display order) as
+    index_dir/page-1.json, page-2.json, ... with page_size posts each.
+
+    Only the short entries are kept in memory, never the post bodies.
+    Shards left over from a previous, larger build are removed. Returns
+    the list of files written.
+    """
+    entries = [listing_entry(article) for article in articles]
+    pages = max(1, -(-len(entries) // page_size))
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for number in range(1, pages + 1):
+        chunk = entries[(number - 1) * page_size:number * page_size]
+        written.append(write_page(index_dir, number, chunk, len(entries), pages))
+
+    for stale in index_dir.glob('page-*.json'):
+        if stale not in written:
+            stale.unlink()
+
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('posts', nargs='?', default='wordpress_posts.jsonl',
+                        help='posts from parse_wordpress_xml.py (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='newsite/index',
+                        help='directory for the shards (default: %(default)s)')
+    parser.add_argument('--page-size', type=int, default=10,
+                        help='posts per shard (default: %(default)s)')
+    args = parser.parse_args()
+
+    written = generate_listing_index(load_articles(args.posts), Path(args.output),
+                                     args.page_size)
+    size = sum(path.stat().st_size for path in written)
+    print(f"Generated {len(written)} listing pages in {args.output}/ ({size / 1024:.1f} KB)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Write width-limited WebP/AVIF derivatives and blurred placeholders of the site images
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError, features
+except ImportError:
+    Image = None
+
+SOURCES = ['foto', 'img', 'oldwp/wp-content/uploads', 'waybiblio/images', 'newsite/images']
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+WIDTHS = (320, 640, 960, 1280, 1920)
+QUALITY = {'webp': 80, 'avif': 60}
+PLACEHOLDER_WIDTH = 16
+MANIFEST_NAME = '.manifest.json'
+
+def formats():
+    """Formats this installation can write: AVIF needs a Pillow built with libavif"""
+    if Image is None:
+        return []
+    return ['webp', 'avif'] if features.check('avif') else ['webp']
+
+def find_images(sources, output_dir):
+    """Image files under the source directories, skipping hidden files and output_dir"""
+    output_dir = Path(output_dir).resolve()
+    for source in sources:
+        for path in sorted(Path(source).rglob('*')):
+            if any(part.startswith('.') for part in path.parts):
+                continue
+            if output_dir in path.resolve().parents:
+                continue
+            if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file():
+                yield path
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def target_widths(width):
+    """Widths of the derivatives of an image: never upscaled, capped at the largest"""
+    return [w for w in WIDTHS if w < width] + [min(width, WIDTHS[-1])]
+
+def derivative_name(digest, width, fmt):
+    """File name of a derivative: identical sources share their derivatives"""
+    return f'{digest[:16]}-{width}.{fmt}'
+
+def _write_atomic(path, data):
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), **options)
+    return buffer.getvalue()
+
+def placeholder(image):
+    """A PLACEHOLDER_WIDTH pixels wide, blurred WebP of image, as a data: URI"""
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR)
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    data = _encode(tiny, 'webp', quality=30)
+    return 'data:image/webp;base64,' + base64.b64encode(data).decode('ascii')
+
+def derive_image(task):
+    """
+    Worker entry point: task is (source path, content digest, output
+    directory, formats). Derivatives already in the output directory are
+    not redone, since their names depend on the content only.
+
+    Returns the manifest entry of the image, or None for animated images,
+    which are left as they are. Images with transparency get no placeholder,
+    since it would show through them.
+    """
+    path, digest, output_dir, fmts = task
+    output_dir = Path(output_dir)
+    with Image.open(path) as image:
+        if getattr(image, 'n_frames', 1) > 1:
+            return None
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {fmt: [] for fmt in fmts}
+    for width in target_widths(image.width):
+        resized = None
+        for fmt in fmts:
+            name = derivative_name(digest, width, fmt)
+            variants[fmt].append([width, name])
+            if (output_dir / name).exists():
+                continue
+            if resized is None:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            _write_atomic(output_dir / name, _encode(resized, fmt, quality=QUALITY[fmt]))
+
+    return {
+        'width': image.width,
+        'height': image.height,
+        'placeholder': None if has_alpha else placeholder(image),
+        'variants': variants,
+    }
+
+def _derive_task(task):
+    """
+    Worker entry point: (derive_image() result, None), or (None, message)
+    if the file is corrupt or not an image, so one bad file does not stop
+    the others.
+    """
+    try:
+        return derive_image(task), None
+    except (OSError, UnidentifiedImageError) as exc:
+        return None, f'{task[0]}: {exc}'
+
+def load_image_manifest(path):
+    """
+    The manifest written by build_derivatives():
+    {'formats': [...], 'sources': {source path: digest},
+     'images': {digest: {'width', 'height', 'placeholder', 'variants'}}}
+    where placeholder is a data: URI or None.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'formats': [], 'sources': {}, 'images': {}}
+
+def srcset(entry, fmt, prefix=''):
+    """srcset attribute value of one format of a manifest entry"""
+    return ', '.join(f'{prefix}{name} {width}w' for width, name in entry['variants'][fmt])
+
+def build_derivatives(sources, output_dir, jobs=1, force=False):
+    """
+    Derive every image under the source directories into output_dir, in a
+    pool of jobs processes.
+
+    Work is cached by content hash: an image whose digest is already in
+    output_dir/.manifest.json, with all its derivatives on disk, is not
+    opened again, and a renamed or duplicated image costs nothing. Derivatives
+    no image refers to any more are deleted. Files that cannot be read are
+    left out of the manifest and tried again next time. Returns (derived,
+    cached, skipped, removed, failed) where skipped counts the animated
+    images and failed lists an error message per unreadable file.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    previous = load_image_manifest(manifest_path)
+    cached_ok = {} if force or previous['formats'] != formats() else previous['images']
+
+    sources_map = {}
+    images = {}
+    todo = {}
+    for path in find_images(sources, output_dir):
+        digest = file_digest(path)
+        sources_map[path.as_posix()] = digest
+        if digest in images or digest in todo:
+            continue
+        entry = cached_ok.get(digest)
+        if entry is not None and all((output_dir / name).exists()
+                                     for variants in entry['variants'].values()
+                                     for _, name in variants):
+            images[digest] = entry
+            continue
+        todo[digest] = path
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    tasks = [(str(path), digest, str(output_dir), formats()) for digest, path in todo.items()]
+    if jobs <= 1:
+        results = [_derive_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_derive_task, tasks))
+
+    skipped = 0
+    failed = []
+    for digest, (entry, error) in zip(todo, results):
+        if error is not None:
+            failed.append(error)
+        elif entry is None:
+            skipped += 1
+        else:
+            images[digest] = entry
+    sources_map = {path: digest for path, digest in sources_map.items() if digest in images}
+
+    in_use = {name for entry in images.values()
+              for variants in entry['variants'].values() for _, name in variants}
+    removed = 0
+    for path in output_dir.iterdir():
+        if path.name != MANIFEST_NAME and not path.name.startswith('.') and path.name not in in_use:
+            path.unlink()
+            removed += 1
+
+    tmp = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'formats': formats(), 'sources': sources_map, 'images': images},
+                  f, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+
+    derived = len(todo) - skipped - len(failed)
+    return derived, len(images) - derived, skipped, removed, failed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('sources', nargs='*', default=SOURCES,
+                        help='directories of source images (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='newsite/images/derived',
+                        help='directory for the derivatives (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='worker processes (0 = one per CPU, default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='derive every image again, cached or not')
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Pillow not installed: image derivatives skipped")
+        return
+
+    derived, cached, skipped, removed, failed = build_derivatives(
+        args.sources, args.output, args.jobs, args.force)
+    for error in failed:
+        print(f"  skipped unreadable image {error}")
+
+    size = sum(path.stat().st_size for path in Path(args.output).iterdir())
+    print(f"Derived {derived} images to {' and '.join(formats())} "
+          f"({cached} cached, {skipped} animated left as is, {removed} stale files removed)")
+    print(f"  {size / 1024:.1f} KB in {args.output}/")
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,10 @@
-// Load articles data
-let articlesData = [];
+// Listing index shards (generate_listing_index.py)
+let nextPage = 1;
+let totalPages = 1;
 
-// Format date
-function formatDate(dateString) {
-    const date = new Date(dateString);
+// Format date (epoch seconds, precomputed by parse_wordpress_xml.py)
+function formatDate(timestamp) {
+    const date = new Date(timestamp * 1000);
     return date.toLocaleDateString('it-IT', {
         year: 'numeric',
         month: 'long',
@@ -11,31 +12,21 @@ function formatDate(dateString) {
     });
 }
 
-// Truncate text
-function truncateText(text, maxLength) {
-    // Remove HTML tags
-    const stripped = text.replace(/<[^>]+>/g, '');
-    if (stripped.length <= maxLength) return stripped;
-    return stripped.substr(0, maxLength) + '...';
-}
-
 // Create article card HTML
 function createArticleCard(article, index) {
-    const excerpt = truncateText(article.content, 200);
-
     return `
         <article class="glass-card-article rounded-2xl p-6 hover:cursor-pointer"
                  onclick="navigateToArticle('${article.slug}')">
             <div class="flex flex-col md:flex-row gap-6">
                 <div class="flex-1">
                     <div class="flex flex-wrap items-center gap-2 mb-3">
-                        <span class="badge badge-date text-white">${formatDate(article.date)}</span>
+                        <span class="badge badge-date text-white">${formatDate(article.timestamp)}</span>
                     </div>
                     <h3 class="text-2xl font-bold text-white mb-3 hover:text-archi-pink transition">
                         ${article.title}
                     </h3>
                     <p class="text-white/80 mb-4 leading-relaxed">
-                        ${excerpt}
+                        ${article.excerpt}
                     </p>
                     <div class="flex items-center text-white/60 text-sm">
                         <svg class="w-4 h-4 mr-2" fill="currentColor" viewBox="0 0 20 20">
@@ -59,15 +50,32 @@ function navigateToArticle(slug) {
     window.location.href = `articles/${slug}.html`;
 }
 
-// Load and display articles
+// Fetch one shard of the listing index
+async function fetchPage(number) {
+    const response = await fetch(`index/page-${number}.json`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+// Show or hide the "load more" button
+function updateLoadMore() {
+    const button = document.getElementById('load-more');
+    if (button) {
+        button.classList.toggle('hidden', nextPage > totalPages);
+    }
+}
+
+// Load and display the next page of articles
 async function loadArticles() {
-    try {
-        const response = await fetch('../wordpress_posts.json');
-        articlesData = await response.json();
+    const articlesList = document.getElementById('articles-list');
 
-        const articlesList = document.getElementById('articles-list');
+    try {
+        const page = await fetchPage(nextPage);
+        totalPages = page.pages;
 
-        if (articlesData.length === 0) {
+        if (page.total === 0) {
             articlesList.innerHTML = `
                 <div class="text-center text-white/60 py-8">
                     <p>Nessun articolo trovato.</p>
@@ -76,24 +84,35 @@ async function loadArticles() {
             return;
         }
 
-        // Display all articles
-        articlesList.innerHTML = articlesData
+        const cards = page.posts
             .map((article, index) => createArticleCard(article, index))
             .join('');
+        if (nextPage === 1) {
+            articlesList.innerHTML = cards;
+        } else {
+            articlesList.insertAdjacentHTML('beforeend', cards);
+        }
+        nextPage += 1;
+        updateLoadMore();
 
     } catch (error) {
         console.error('Error loading articles:', error);
-        document.getElementById('articles-list').innerHTML = `
+        articlesList.insertAdjacentHTML('beforeend', `
             <div class="text-center text-white/80 py-8">
                 <p>Errore nel caricamento degli articoli.</p>
             </div>
-        `;
+        `);
     }
 }
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', () => {
     loadArticles();
+
+    const button = document.getElementById('load-more');
+    if (button) {
+        button.addEventListener('click', loadArticles);
+    }
 });
 
 // Add smooth scroll behavior
@@ -0,0 +1,136 @@
+// Full-text search over the index built by search_index.py.
+// Tokenization mirrors search_index.tokenize(); only the shards of the
+// query terms are fetched.
+const searchIndex = {
+    meta: null,
+    docs: null,
+    stopwords: null,
+    shards: new Map()
+};
+
+// Lowercase and strip accents, like search_index.fold()
+function foldText(text) {
+    return text.toLowerCase().normalize('NFKD').replace(/[\u0300-\u036f]/g, '');
+}
+
+// Light Italian stemmer, like search_index.stem()
+function stemWord(word) {
+    if (word.length <= 3 || /^[0-9]+$/.test(word)) return word;
+    if (word.length > 4 && ['che', 'chi', 'ghe', 'ghi'].includes(word.slice(-3))) {
+        return word.slice(0, -2);
+    }
+    if ('aeio'.includes(word.slice(-1))) return word.slice(0, -1);
+    return word;
+}
+
+function tokenizeQuery(text) {
+    const tokens = foldText(text).match(/[a-z0-9]+/g) || [];
+    return tokens
+        .filter(token => !searchIndex.stopwords.has(token))
+        .map(stemWord);
+}
+
+async function fetchJSON(path) {
+    const response = await fetch(`search/${path}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+async function loadSearchIndex() {
+    if (!searchIndex.meta) {
+        [searchIndex.meta, searchIndex.docs] = await Promise.all([
+            fetchJSON('meta.json'),
+            fetchJSON('docs.json')
+        ]);
+        searchIndex.stopwords = new Set(searchIndex.meta.stopwords);
+    }
+}
+
+async function loadShard(key) {
+    if (!searchIndex.shards.has(key)) {
+        const shard = searchIndex.meta.shards.includes(key)
+            ? fetchJSON(`terms-${key}.json`)
+            : Promise.resolve({});
+        searchIndex.shards.set(key, shard);
+    }
+    return searchIndex.shards.get(key);
+}
+
+// Flat [id delta, weight, ...] -> Map of doc id -> weight
+function decodePostings(encoded) {
+    const postings = new Map();
+    let docId = 0;
+    for (let i = 0; i < encoded.length; i += 2) {
+        docId += encoded[i];
+        postings.set(docId, encoded[i + 1]);
+    }
+    return postings;
+}
+
+// Documents containing every query term, best first (as SearchIndex.search())
+async function searchArticles(query, limit = 10) {
+    await loadSearchIndex();
+    const terms = [...new Set(tokenizeQuery(query))];
+    if (terms.length === 0) return [];
+
+    const prefixLength = searchIndex.meta.prefix_length;
+    const shards = await Promise.all(terms.map(term => loadShard(term.slice(0, prefixLength))));
+
+    let scores = null;
+    terms.forEach((term, i) => {
+        const found = decodePostings(shards[i][term] || []);
+        if (scores === null) {
+            scores = found;
+            return;
+        }
+        const merged = new Map();
+        scores.forEach((score, docId) => {
+            if (found.has(docId)) merged.set(docId, score + found.get(docId));
+        });
+        scores = merged;
+    });
+
+    return [...scores.entries()]
+        .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+        .slice(0, limit)
+        .map(([docId, score]) => ({ ...searchIndex.docs[docId], score }));
+}
+
+function renderSearchResults(results, container) {
+    if (results.length === 0) {
+        container.innerHTML = `
+            <p class="text-white/60 py-4">Nessun risultato.</p>
+        `;
+        return;
+    }
+    container.innerHTML = results.map(doc => `
+        <a href="articles/${doc.slug}.html" class="block glass-card-article rounded-2xl p-4 text-white hover:text-archi-pink transition">
+            ${doc.title}
+        </a>
+    `).join('');
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const input = document.getElementById('search-input');
+    const container = document.getElementById('search-results');
+    if (!input || !container) return;
+
+    let timer = null;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const query = input.value.trim();
+            if (!query) {
+                container.innerHTML = '';
+                return;
+            }
+            try {
+                renderSearchResults(await searchArticles(query), container);
+            } catch (error) {
+                console.error('Error searching articles:', error);
+            }
+        }, 200);
+    });
+});
@@ -4,10 +4,19 @@ Parse WordPress XML export and generate JSON data for the new site
 """
 
 import xml.etree.ElementTree as ET
+import argparse
+import hashlib
 import json
-from datetime import datetime
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import html
+import fix_encoding as encoding
 from fix_encoding import fix_encoding
+from profiling import add_profile_argument, profiling
 
 # WordPress XML namespaces
 namespaces = {
@@ -17,91 +26,509 @@ namespaces = {
     'excerpt': 'http://wordpress.org/export/1.2/excerpt/'
 }
 
-def parse_wordpress_xml(xml_file):
-    """Parse WordPress XML export and extract posts"""
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+def iter_items(xml_file):
+    """
+    Yield the <item> elements of a WordPress export one at a time.
 
-    posts = []
+    The file is read incrementally with iterparse; each item is cleared and
+    detached from <channel> as soon as the caller moves on, so memory stays
+    bounded by the largest single item rather than by the whole export.
+    """
+    channel = None
+    for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'channel':
+                channel = elem
+            continue
 
-    # Find all items in the channel
-    for item in root.findall('.//item'):
-        # Get post type
-        post_type = item.find('wp:post_type', namespaces)
-        if post_type is None or post_type.text != 'post':
+        if elem.tag != 'item':
             continue
 
-        # Get post status
-        status = item.find('wp:status', namespaces)
-        if status is None or status.text != 'publish':
+        yield elem
+
+        elem.clear()
+        if channel is not None:
+            channel.remove(elem)
+
+def open_repaired(xml_file):
+    """
+    Repair double-encoded UTF-8 in the raw bytes of an export before parsing.
+
+    The file is memory-mapped and fixed in one pass by
+    encoding.repair_file(); the result goes to an anonymous temporary file,
+    rewound so that it can be handed to iter_items() or
+    parse_wordpress_xml() in place of the path. Returns (file, runs repaired).
+    """
+    f = tempfile.TemporaryFile()
+    try:
+        repaired = encoding.repair_file(xml_file, f)
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f, repaired
+
+# Fully qualified child tag -> post field. Only the first occurrence of each
+# tag is used, matching what item.find() returned.
+ITEM_FIELDS = {
+    'title': 'title',
+    'link': 'url',
+    'guid': 'guid',
+    'pubDate': 'date',
+    '{%s}creator' % namespaces['dc']: 'author',
+    '{%s}encoded' % namespaces['content']: 'content',
+    '{%s}encoded' % namespaces['excerpt']: 'excerpt',
+    '{%s}post_name' % namespaces['wp']: 'slug',
+    '{%s}post_id' % namespaces['wp']: 'id',
+    '{%s}post_type' % namespaces['wp']: 'post_type',
+    '{%s}status' % namespaces['wp']: 'status',
+}
+
+# <category domain="..."> -> post list field
+CATEGORY_DOMAINS = {
+    'category': 'categories',
+    'post_tag': 'tags',
+}
+
+def read_item(item):
+    """
+    Read the raw fields of a published post from an <item> element.
+
+    Walks the children of the item once and dispatches on the tag through
+    ITEM_FIELDS, instead of one find() per field. Text is returned exactly
+    as found in the export; see repair_post() for the encoding fixes.
+    Returns None for anything that is not a published post.
+    """
+    fields = {}
+    terms = {'categories': [], 'tags': []}
+
+    for child in item:
+        tag = child.tag
+        if tag == 'category':
+            key = CATEGORY_DOMAINS.get(child.get('domain'))
+            if key is not None and child.text:
+                terms[key].append(child.text)
             continue
 
-        # Extract post data
-        post = {}
+        name = ITEM_FIELDS.get(tag)
+        if name is not None and name not in fields:
+            fields[name] = child.text
+
+    if fields.get('post_type') != 'post' or fields.get('status') != 'publish':
+        return None
 
-        # Basic fields
-        title_elem = item.find('title')
-        title_raw = title_elem.text if title_elem is not None and title_elem.text else 'Untitled'
-        post['title'] = fix_encoding(title_raw)
+    return {
+        'title': fields.get('title') or 'Untitled',
+        'url': fields.get('url', ''),
+        'date': fields.get('date', ''),
+        'author': fields.get('author', 'Unknown'),
+        'content': fields.get('content') or '',
+        'excerpt': fields.get('excerpt') or '',
+        'slug': fields.get('slug') or '',
+        'id': fields.get('id', ''),
+        'guid': fields.get('guid') or '',
+        'categories': terms['categories'],
+        'tags': terms['tags'],
+    }
 
-        link_elem = item.find('link')
-        post['url'] = link_elem.text if link_elem is not None else ''
+def parse_pubdate(value):
+    """
+    Parse an RFC 822 <pubDate> once, for sorting and display downstream.
 
-        pubdate_elem = item.find('pubDate')
-        post['date'] = pubdate_elem.text if pubdate_elem is not None else ''
+    Returns (epoch seconds, ISO 8601 string), or (0, '') if the date is
+    missing or malformed. Dates without a zone are taken as UTC.
+    """
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0, ''
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp()), date.isoformat()
 
-        creator_elem = item.find('dc:creator', namespaces)
-        author_raw = creator_elem.text if creator_elem is not None else 'Unknown'
-        post['author'] = fix_encoding(author_raw)
+def repair_post(post):
+    """
+    Return a copy of a raw post with fix_encoding() applied to its text
+    fields, and the date also given as 'timestamp' and 'date_iso'
+    """
+    timestamp, date_iso = parse_pubdate(post['date'])
+    return {
+        'title': fix_encoding(post['title']),
+        'url': post['url'],
+        'date': post['date'],
+        'timestamp': timestamp,
+        'date_iso': date_iso,
+        'author': fix_encoding(post['author']),
+        'content': fix_encoding(post['content']),
+        'excerpt': fix_encoding(post['excerpt']),
+        'slug': post['slug'],
+        'id': post['id'],
+        'categories': [fix_encoding(c) for c in post['categories']],
+        'tags': [fix_encoding(t) for t in post['tags']],
+    }
 
-        # Content
-        content_elem = item.find('content:encoded', namespaces)
-        content_raw = content_elem.text if content_elem is not None and content_elem.text else ''
-        post['content'] = fix_encoding(content_raw)
+def extract_post(item):
+    """Extract a published post from an <item> element, or None to skip it"""
+    post = read_item(item)
+    if post is None:
+        return None
+    return repair_post(post)
 
-        # Excerpt
-        excerpt_elem = item.find('excerpt:encoded', namespaces)
-        excerpt_raw = excerpt_elem.text if excerpt_elem is not None and excerpt_elem.text else ''
-        post['excerpt'] = fix_encoding(excerpt_raw)
+def _repair_chunk(posts):
+    """Worker entry point: repair a chunk of raw posts, with the counters it used"""
+    encoding.reset_stats()
+    return [repair_post(post) for post in posts], encoding.get_stats()
 
-        # Post name (slug)
-        post_name = item.find('wp:post_name', namespaces)
-        post['slug'] = post_name.text if post_name is not None and post_name.text else ''
+def chunked(iterable, size):
+    """Group an iterable into lists of at most `size` elements"""
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
-        # Post ID
-        post_id = item.find('wp:post_id', namespaces)
-        post['id'] = post_id.text if post_id is not None else ''
+def iter_wordpress_posts(xml_file, jobs=1, chunk_size=64, manifest=None):
+    """
+    Yield published posts in document order, one finished dict at a time.
 
-        # Categories
-        categories = []
-        for category in item.findall('category[@domain="category"]'):
-            if category.text:
-                categories.append(fix_encoding(category.text))
-        post['categories'] = categories
+    With jobs > 1 the XML is still read in this process, but the raw posts
+    are sent in chunks to a pool of worker processes for fix_encoding().
+    Results are yielded in submission order, so the output is the same as
+    with a single job, and only a few chunks per worker are in flight at
+    any time.
 
-        # Tags
-        tags = []
-        for tag in item.findall('category[@domain="post_tag"]'):
-            if tag.text:
-                tags.append(fix_encoding(tag.text))
-        post['tags'] = tags
+    With a PostManifest, posts whose raw fields are unchanged since the
+    previous run are taken from it instead of being repaired again, and
+    every post is recorded in it.
+    """
+    raw_posts = (post for post in map(read_item, iter_items(xml_file)) if post is not None)
+    return repair_posts(raw_posts, jobs, chunk_size, manifest)
 
+def repair_posts(raw_posts, jobs=1, chunk_size=64, manifest=None):
+    """
+    Yield the finished post of each raw post from read_item(), in order:
+    the repair half of iter_wordpress_posts(), for callers that read the
+    items themselves.
+    """
+    if manifest is None:
+        entries = ((post, None) for post in raw_posts)
+    else:
+        entries = manifest.match(raw_posts)
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        for raw, post in entries:
+            if post is None:
+                post = repair_post(raw)
+            if manifest is not None:
+                manifest.record(raw, post)
+            yield post
+        return
+
+    # Workers get the same cache settings as this process
+    settings = encoding.cache_settings()
+    initializer = None if settings is None else encoding.enable_cache
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                             initargs=settings or ()) as executor:
+        pending = deque()
+        for chunk in chunked(entries, chunk_size):
+            fresh = [raw for raw, post in chunk if post is None]
+            pending.append((chunk, executor.submit(_repair_chunk, fresh)))
+            if len(pending) >= 2 * jobs:
+                yield from _collect(*pending.popleft(), manifest)
+
+        while pending:
+            yield from _collect(*pending.popleft(), manifest)
+
+def _collect(chunk, future, manifest):
+    """
+    Put a chunk back together from the manifest hits and the _repair_chunk()
+    result for the rest, folding the worker's counters into ours.
+    """
+    repaired, stats = future.result()
+    encoding.merge_stats(stats)
+    repaired = iter(repaired)
+    posts = []
+    for raw, post in chunk:
+        if post is None:
+            post = next(repaired)
+        if manifest is not None:
+            manifest.record(raw, post)
         posts.append(post)
+    return posts
+
+# Raise it after changing read_item() or repair_post(): processing_version()
+# follows the REPLACEMENTS table on its own, but not the code around it
+PROCESSING_VERSION = 1
+
+def processing_version(prerepair=False):
+    """
+    Fingerprint of what turns raw posts into finished ones: PROCESSING_VERSION,
+    the fix_encoding() replacement table and --prerepair. Any change to them
+    invalidates every entry of a PostManifest.
+    """
+    encoded = json.dumps([PROCESSING_VERSION, encoding.REPLACEMENTS, prerepair],
+                         ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class PostManifest:
+    """
+    Processed posts of the previous run, keyed on wp:post_id and <guid>.
+
+    Each entry holds a SHA-256 of the raw fields read_item() returned for
+    the post, its title for the report, and where the finished post is in
+    the JSON Lines file next to the manifest (path + '.posts'). On the next
+    run match() reads the stored post back from that file whenever the hash
+    is unchanged, so only new and edited posts go through fix_encoding(),
+    and only the small entries are held in memory. Items sharing an id and
+    guid (merged exports) are repaired each time and listed as duplicates;
+    the first one is the one stored. The manifest is discarded as a whole if
+    processing_version() has changed.
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.posts_path = f"{path}.posts"
+        self.version = version
+        self.previous = {}
+        self.entries = {}
+        self.added = []
+        self.changed = []
+        self.duplicates = []
+        self._previous_posts = None
+        self._posts = None
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get('version') != version:
+            return
+        try:
+            self._previous_posts = open(self.posts_path, 'rb')
+        except FileNotFoundError:
+            return
+        self.previous = data['posts']
+
+    @staticmethod
+    def key(raw):
+        """Manifest key of a raw post: wp:post_id alone is not unique across blogs"""
+        return f"{raw['id']} {raw['guid']}"
+
+    @staticmethod
+    def digest(raw):
+        """Hash of the raw fields of a post"""
+        encoded = json.dumps(raw, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _load(self, entry):
+        """The finished post an entry of the previous run points at"""
+        self._previous_posts.seek(entry['offset'])
+        return json.loads(self._previous_posts.read(entry['length']))
+
+    def match(self, raw_posts):
+        """Yield (raw, stored post or None) for each raw post"""
+        for raw in raw_posts:
+            key = self.key(raw)
+            if key in self.entries:
+                self.duplicates.append(key)
+                yield raw, None
+                continue
+
+            digest = self.digest(raw)
+            entry = self.previous.get(key)
+            self.entries[key] = {'id': raw['id'], 'hash': digest}
+            if entry is None:
+                self.added.append(key)
+            elif entry['hash'] != digest:
+                self.changed.append(key)
+            else:
+                yield raw, self._load(entry)
+                continue
+            yield raw, None
+
+    def record(self, raw, post):
+        """Store the finished post for a raw post seen by match(), in document order"""
+        entry = self.entries[self.key(raw)]
+        if 'offset' in entry:
+            return  # a duplicate: the first item is the one stored
+        if self._posts is None:
+            self._posts = open(f"{self.posts_path}.tmp", 'wb')
+        line = json.dumps(post, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry.update(title=post['title'], offset=self._posts.tell(), length=len(line))
+        self._posts.write(line + b'\n')
+
+    @property
+    def removed(self):
+        return [key for key in self.previous if key not in self.entries]
+
+    def report(self):
+        """Summary of what changed since the previous run"""
+        unchanged = len(self.entries) - len(self.added) - len(self.changed)
+        lines = [f"Manifest: {len(self.added)} added, {len(self.changed)} changed, "
+                 f"{len(self.removed)} removed, {unchanged} unchanged"]
+        for label, keys, entries in (('added', self.added, self.entries),
+                                     ('changed', self.changed, self.entries),
+                                     ('removed', self.removed, self.previous)):
+            for key in keys:
+                lines.append(f"  {label}: {entries[key]['id']} {entries[key]['title']}")
+        if self.duplicates:
+            lines.append(f"Warning: {len(self.duplicates)} items repeat the post id "
+                         f"and guid of an earlier one; only the first is stored")
+            for key in self.duplicates:
+                lines.append(f"  duplicate: {key}")
+        return '\n'.join(lines)
+
+    def save(self):
+        """Write the manifest and its posts for the next run, replacing the old ones atomically"""
+        if self._posts is None:
+            self._posts = open(f"{self.posts_path}.tmp", 'wb')
+        self._posts.close()
+        if self._previous_posts is not None:
+            self._previous_posts.close()
+        os.replace(f"{self.posts_path}.tmp", self.posts_path)
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'posts': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+def parse_wordpress_xml(xml_file, jobs=1, manifest=None):
+    """Parse WordPress XML export and extract posts"""
+    posts = list(iter_wordpress_posts(xml_file, jobs=jobs, manifest=manifest))
 
     # Sort by date (newest first)
-    posts.sort(key=lambda x: x['date'], reverse=True)
+    posts.sort(key=lambda x: x['timestamp'], reverse=True)
 
     return posts
 
-if __name__ == '__main__':
-    xml_file = 'bibliotecaarchimedica.wordpress.2016-03-26.xml'
-    posts = parse_wordpress_xml(xml_file)
+def write_posts_json(posts, f):
+    """
+    Write posts to an open text file as a JSON array, one post at a time.
+
+    The output is identical to json.dump(posts, f, indent=2, ensure_ascii=False),
+    but posts can come from a generator and are never held in memory together.
+    Returns the number of posts written.
+    """
+    count = 0
+    for post in posts:
+        f.write('[\n' if count == 0 else ',\n')
+        encoded = json.dumps(post, indent=2, ensure_ascii=False)
+        f.write('\n'.join('  ' + line for line in encoded.split('\n')))
+        count += 1
 
-    # Save to JSON
-    with open('wordpress_posts.json', 'w', encoding='utf-8') as f:
-        json.dump(posts, f, indent=2, ensure_ascii=False)
+    f.write('\n]' if count else '[]')
+    return count
+
+def write_posts_jsonl(posts, f):
+    """
+    Write posts to an open text file as JSON Lines, one compact object per
+    line, as they arrive. Returns the number of posts written.
+    """
+    count = 0
+    for post in posts:
+        f.write(json.dumps(post, ensure_ascii=False, separators=(',', ':')))
+        f.write('\n')
+        count += 1
+    return count
+
+def read_posts_jsonl(path):
+    """Yield the posts of a JSON Lines file lazily, one line at a time"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('xml_file', nargs='?',
+                        default='bibliotecaarchimedica.wordpress.2016-03-26.xml',
+                        help='WordPress WXR export to parse')
+    parser.add_argument('-o', '--output', default='wordpress_posts.jsonl',
+                        help='JSON Lines file to write, one post per line '
+                             '(default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='also write the posts as an indented JSON array, '
+                             'the format of the old wordpress_posts.json')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream posts to the output in document order '
+                             'instead of sorting them by date; memory use stays '
+                             'flat regardless of the export size')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes for encoding repair '
+                             '(0 = one per CPU, default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='cache the repaired form of up to this many short '
+                             'strings (authors, categories, tags); 0 disables')
+    parser.add_argument('--cache-max-length', type=int, default=200,
+                        help='only cache strings shorter than this '
+                             '(default: %(default)s)')
+    parser.add_argument('--prerepair', action='store_true',
+                        help='repair double-encoded UTF-8 in the raw export '
+                             '(memory-mapped, one pass) before parsing it')
+    parser.add_argument('--manifest', metavar='PATH',
+                        help='reuse the processed posts recorded in this file '
+                             '(and PATH.posts) for items unchanged since the '
+                             'last run, and update it (created if missing)')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.output):
+        run(args)
+
+def run(args):
+    if args.cache_size > 0:
+        encoding.enable_cache(args.cache_size, args.cache_max_length)
+
+    source = args.xml_file
+    if args.prerepair:
+        source, repaired = open_repaired(args.xml_file)
+        print(f"Pre-repaired {repaired} double-encoded sequences")
+
+    manifest = None
+    if args.manifest:
+        manifest = PostManifest(args.manifest, processing_version(args.prerepair))
+
+    if args.stream:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            posts = iter_wordpress_posts(source, jobs=args.jobs, manifest=manifest)
+            count = write_posts_jsonl(posts, f)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                write_posts_json(read_posts_jsonl(args.output), f)
+        print(f"Extracted {count} published posts")
+        if manifest is not None:
+            manifest.save()
+            print(manifest.report())
+        print(encoding.format_stats())
+        return
+
+    posts = parse_wordpress_xml(source, jobs=args.jobs, manifest=manifest)
+
+    # Save to JSON Lines, and optionally to JSON
+    with open(args.output, 'w', encoding='utf-8') as f:
+        write_posts_jsonl(posts, f)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            write_posts_json(posts, f)
 
     print(f"Extracted {len(posts)} published posts")
     print("\nPosts:")
     for i, post in enumerate(posts, 1):
         print(f"{i}. {post['title']} ({post['date']})")
+
+    if manifest is not None:
+        manifest.save()
+        print(f"\n{manifest.report()}")
+
+    print(f"\n{encoding.format_stats()}")
+
+if __name__ == '__main__':
+    main()
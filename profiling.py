@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Optional cProfile and tracemalloc capture for the command-line scripts
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+TOP = 30
+
+def add_profile_argument(parser):
+    """Add the --profile switch shared by every entry point"""
+    parser.add_argument('--profile', action='store_true',
+                        help='record cProfile stats and tracemalloc peak/top '
+                             'allocations of this process, written as '
+                             '<output>.profile.pstats and .json (a hidden .profile.* '
+                             'inside the output when it is a directory)')
+
+def profile_paths(output):
+    """(pstats path, JSON path) for the profile of a run writing to output"""
+    output = Path(output)
+    base = output / '.profile' if output.is_dir() else output.with_name(output.name + '.profile')
+    return base.with_name(base.name + '.pstats'), base.with_name(base.name + '.json')
+
+def function_stats(stats, top=TOP):
+    """The top functions of a pstats.Stats by cumulative time, as dicts"""
+    rows = []
+    for (filename, line, name), (primitive, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{filename}:{line}({name})',
+            'calls': calls,
+            'primitive_calls': primitive,
+            'total_time': round(total, 6),
+            'cumulative_time': round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row['cumulative_time'], reverse=True)
+    return rows[:top]
+
+def allocation_stats(snapshot, top=TOP):
+    """The source lines holding the most traced memory in a snapshot, as dicts"""
+    return [{
+        'line': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+    } for stat in snapshot.statistics('lineno')[:top]]
+
+@contextmanager
+def profiling(enabled, output, top=TOP):
+    """
+    Profile the body of a with block when enabled; otherwise do nothing at
+    all, so the switch costs nothing when it is off.
+
+    Writes the full cProfile stats (loadable with pstats or any viewer that
+    reads them) and a JSON summary: wall and CPU time, the top functions by
+    cumulative time, the tracemalloc peak and the lines holding the most
+    memory when the block ends. Only this process is profiled, not the
+    workers of a process pool. Tracing memory slows the run down, so the
+    times are only meaningful relative to each other.
+    """
+    if not enabled:
+        yield
+        return
+
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    wall, cpu = time.perf_counter(), time.process_time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats_path, json_path = profile_paths(output)
+        stats_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(stats_path)
+        summary = {
+            'command': sys.argv,
+            'wall_time': round(wall, 6),
+            'cpu_time': round(cpu, 6),
+            'functions': function_stats(pstats.Stats(profiler), top),
+            'memory': {
+                'peak_kb': round(peak / 1024, 1),
+                'top': allocation_stats(snapshot, top),
+            },
+        }
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+        print(f"Profile written to {stats_path} and {json_path}", file=sys.stderr)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Build the full-text search index of the article corpus for the newsite
+"""
+
+import argparse
+import html
+import json
+import re
+import shutil
+import tempfile
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+from generate_article_pages import article_slug, load_articles
+
+# Common Italian words not worth indexing (also written to meta.json so the
+# browser client tokenizes queries the same way)
+STOPWORDS = frozenset('''
+    a ad al alla alle allo ai agli all anche ancora avere c che chi ci come con
+    cosa da dal dalla dalle dallo dai dagli d del della delle dello dei degli
+    di dove e ed era essere fa gli ha hanno ho i il in io l la le lei lo loro
+    lui ma mi mio ne nei negli nel nella nelle nello no noi non o per perche
+    piu poi quale quando quella quelle quello questa queste questo qui se si
+    sia sono su sua sue sui sul sulla suo tra fra tu tutto un una uno vi voi
+'''.split())
+
+TAG_RE = re.compile(r'<[^>]+>')
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Weight of one occurrence of a term, per field
+FIELD_WEIGHTS = {
+    'title': 3,
+    'tags': 2,
+    'categories': 2,
+    'content': 1,
+}
+
+PREFIX_LENGTH = 2
+
+def fold(text):
+    """Lowercase and strip accents: 'Perché Più' -> 'perche piu'"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def stem(word):
+    """
+    Light Italian stemmer: undo the plural/gender ending of a folded word.
+
+    Only the final vowel is removed ('-che/-chi/-ghe/-ghi' lose their 'h'
+    too), so 'libro' and 'libri' or 'biblioteca' and 'biblioteche' meet on
+    the same term while 'bibliotecario' stays apart. Words of up to 3
+    letters and numbers are left alone.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if len(word) > 4 and word[-3:] in ('che', 'chi', 'ghe', 'ghi'):
+        return word[:-2]
+    if word[-1] in 'aeio':
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    """Stemmed, folded index terms of a piece of text, stopwords removed"""
+    return [stem(token) for token in TOKEN_RE.findall(fold(text))
+            if token not in STOPWORDS]
+
+def plain_text(content):
+    """Text of an HTML post body"""
+    return html.unescape(TAG_RE.sub(' ', content))
+
+def document_terms(article):
+    """Weighted term counts of one article, over all indexed fields"""
+    weights = defaultdict(int)
+    fields = {
+        'title': article['title'],
+        'tags': ' '.join(article['tags']),
+        'categories': ' '.join(article['categories']),
+        'content': plain_text(article['content']),
+    }
+    for field, text in fields.items():
+        for term in tokenize(text):
+            weights[term] += FIELD_WEIGHTS[field]
+    return weights
+
+def shard_key(term):
+    """Name of the shard a term lives in: its first PREFIX_LENGTH characters"""
+    return term[:PREFIX_LENGTH]
+
+def encode_postings(postings):
+    """[(doc id, weight), ...] sorted by id -> flat [id delta, weight, ...]"""
+    encoded = []
+    previous = 0
+    for doc_id, weight in postings:
+        encoded.append(doc_id - previous)
+        encoded.append(weight)
+        previous = doc_id
+    return encoded
+
+def decode_postings(encoded):
+    """Inverse of encode_postings()"""
+    postings = []
+    doc_id = 0
+    for i in range(0, len(encoded), 2):
+        doc_id += encoded[i]
+        postings.append((doc_id, encoded[i + 1]))
+    return postings
+
+def build_search_index(articles, output_dir):
+    """
+    Write the inverted index of articles to output_dir.
+
+    Documents are numbered in corpus order; docs.json lists what a result
+    shows (slug, title, date), terms-<prefix>.json hold the postings of
+    every term starting with <prefix>, and meta.json the parameters a
+    client needs. The directory is replaced as a whole, so shards of terms
+    that disappeared do not linger. Returns (documents, terms, shards).
+    """
+    docs = []
+    index = defaultdict(list)
+    for doc_id, article in enumerate(articles):
+        docs.append({
+            'slug': article_slug(article),
+            'title': article['title'],
+            'date_iso': article['date_iso'],
+        })
+        for term, weight in document_terms(article).items():
+            index[term].append((doc_id, weight))
+
+    shards = defaultdict(dict)
+    for term in sorted(index):
+        shards[shard_key(term)][term] = encode_postings(index[term])
+
+    output_dir = Path(output_dir)
+    output_dir.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix='.search-', dir=output_dir.parent))
+
+    def dump(name, data):
+        with open(staging / name, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+    dump('docs.json', docs)
+    for key, terms in shards.items():
+        dump(f'terms-{key}.json', terms)
+    dump('meta.json', {
+        'documents': len(docs),
+        'terms': len(index),
+        'prefix_length': PREFIX_LENGTH,
+        'shards': sorted(shards),
+        'stopwords': sorted(STOPWORDS),
+    })
+
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    staging.rename(output_dir)
+    return len(docs), len(index), len(shards)
+
+class SearchIndex:
+    """
+    Query API over a directory written by build_search_index().
+
+    Shards are loaded on first use, like the browser client does, so a
+    query only reads the shards of its own terms.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / 'meta.json', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(self.directory / 'docs.json', encoding='utf-8') as f:
+            self.docs = json.load(f)
+        self._shards = {}
+
+    def shard(self, key):
+        """Terms of one shard, {} if there is no such shard"""
+        if key not in self._shards:
+            self._shards[key] = {}
+            if key in self.meta['shards']:
+                with open(self.directory / f'terms-{key}.json', encoding='utf-8') as f:
+                    self._shards[key] = json.load(f)
+        return self._shards[key]
+
+    def postings(self, term):
+        """[(doc id, weight), ...] of an index term"""
+        return decode_postings(self.shard(shard_key(term)).get(term, []))
+
+    def search(self, query, limit=10):
+        """
+        Documents containing every term of the query, best first.
+
+        Each result is a docs.json entry with its 'score' (the summed
+        weights of the query terms) added.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores = None
+        for term in dict.fromkeys(terms):
+            found = dict(self.postings(term))
+            if scores is None:
+                scores = found
+            else:
+                scores = {doc_id: score + found[doc_id]
+                          for doc_id, score in scores.items() if doc_id in found}
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [dict(self.docs[doc_id], score=score) for doc_id, score in ranked[:limit]]
+
+def test_search_index():
+    """Build an index of a small corpus and check some queries against it"""
+    articles = [
+        {'slug': 'libri', 'id': '1', 'title': 'Libri di Città', 'date_iso': '2008-01-02T00:00:00+00:00',
+         'content': '<p>Nuovi <b>libri</b> in biblioteca &amp; perché no</p>',
+         'tags': ['lettura'], 'categories': ['eventi']},
+        {'slug': '', 'id': '2', 'title': 'Le biblioteche di Second Life', 'date_iso': '',
+         'content': 'Un libro sulla città virtuale.', 'tags': [], 'categories': ['Eventi']},
+    ]
+
+    cases = [
+        ('libro', ['libri', '2']),         # plural/singular, title weighs more
+        ('CITTA', ['libri', '2']),         # accents and case folded
+        ('Perché NUOVI', ['libri']),       # stopword ignored
+        ('biblioteche', ['2', 'libri']),   # plural of 'biblioteca' in the body of 'libri'
+        ('libri virtuale', ['2']),         # every term required
+        ('di il la', []),                  # only stopwords
+        ('eventi', ['libri', '2']),
+        ('inesistente', []),
+    ]
+
+    print("Testing search index:\n")
+    all_passed = True
+    with tempfile.TemporaryDirectory() as tmp:
+        build_search_index(articles, Path(tmp) / 'search')
+        index = SearchIndex(Path(tmp) / 'search')
+        for query, expected in cases:
+            result = [doc['slug'] for doc in index.search(query)]
+            status = "✓" if result == expected else "✗"
+            if result != expected:
+                all_passed = False
+            print(f"{status} {query!r} → {result} (expected: {expected})")
+
+    assert decode_postings(encode_postings([(2, 1), (5, 3), (40, 2)])) == [(2, 1), (5, 3), (40, 2)]
+
+    print("\n" + ("All tests passed!" if all_passed else "Some tests failed"))
+    return all_passed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('posts', nargs='?', default='wordpress_posts.jsonl',
+                        help='posts from parse_wordpress_xml.py (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='newsite/search',
+                        help='directory for the index (default: %(default)s)')
+    parser.add_argument('-q', '--query',
+                        help='search the index in --output instead of building it')
+    parser.add_argument('--test', action='store_true',
+                        help='run the self-test on a small built-in corpus')
+    args = parser.parse_args()
+
+    if args.test:
+        raise SystemExit(0 if test_search_index() else 1)
+
+    if args.query:
+        for doc in SearchIndex(args.output).search(args.query):
+            print(f"{doc['score']:4d}  {doc['title']} (articles/{doc['slug']}.html)")
+        return
+
+    documents, terms, shards = build_search_index(load_articles(args.posts), args.output)
+    size = sum(path.stat().st_size for path in Path(args.output).iterdir())
+    print(f"Indexed {documents} articles: {terms} terms in {shards} shards "
+          f"({size / 1024:.1f} KB) in {args.output}/")
+
+if __name__ == '__main__':
+    main()
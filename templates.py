@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Precompiled templates for the HTML and Markdown written by the build scripts
+"""
+
+import html
+import re
+
+# {{name}} or {{name|filter}}
+SLOT_RE = re.compile(r'\{\{\s*(\w+)\s*(?:\|\s*(\w+)\s*)?\}\}')
+
+# How a value is escaped before it goes into its slot
+FILTERS = {
+    'html': lambda value: html.escape(str(value), quote=False),
+    'attr': lambda value: html.escape(str(value), quote=True),
+    'raw': str,
+}
+
+class Template:
+    """
+    A text with {{name}} slots, compiled once at load time.
+
+    The source is split into constant chunks and slots, and turned into a
+    small function that builds the list of chunks (already its final size)
+    with each escaped value in its slot, to be joined once; no parsing or
+    formatting work is repeated per page. A slot is escaped with its own
+    filter, {{name|raw}} or {{name|attr}}, or with the template default:
+    'html' for markup, 'raw' for Markdown and other plain text.
+    """
+
+    def __init__(self, source, default='html'):
+        self.source = source
+        items = []
+        filters = {}
+
+        position = 0
+        for match in SLOT_RE.finditer(source):
+            if match.start() > position:
+                items.append(repr(source[position:match.start()]))
+            name, filter_name = match.group(1), match.group(2) or default
+            if filter_name not in FILTERS:
+                raise ValueError(f"Unknown filter {filter_name!r} for slot {name!r}")
+            filters[f'_{filter_name}'] = FILTERS[filter_name]
+            items.append(f'_{filter_name}(values[{name!r}])')
+            position = match.end()
+        if position < len(source):
+            items.append(repr(source[position:]))
+
+        code = f"def parts(values):\n    return [{', '.join(items)}]\n"
+        namespace = dict(filters)
+        exec(compile(code, f'<template {source[:30]!r}>', 'exec'), namespace)
+        self._parts = namespace['parts']
+
+    def parts(self, values):
+        """The chunks of the rendered text, with the slots filled from values"""
+        return self._parts(values)
+
+    def render(self, **values):
+        """Render to a string"""
+        return ''.join(self._parts(values))
+
+    def render_each(self, items):
+        """Render once per dict of values and concatenate, for repeated sections"""
+        parts = self._parts
+        return ''.join([''.join(parts(values)) for values in items])
+
+    def write(self, f, **values):
+        """Render straight into an open text file"""
+        f.writelines(self._parts(values))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Cache persistente su disco delle risposte HTTP per gli scraper
+Le catture della Wayback Machine a un timestamp fisso non cambiano mai,
+quindi una risposta scaricata una volta può essere riusata per sempre
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Nome del database nella directory di output, se non indicato altrimenti
+CACHE_NAME = '.http-cache.sqlite'
+
+# URL di una cattura a timestamp completo (con l'eventuale modificatore,
+# come im_ o id_): il solo tipo di risposta che non cambia mai
+CAPTURE_URL = re.compile(r'^https?://web\.archive\.org/web/\d{14}(?:[a-z]{2}_)?/')
+
+
+def capture_timestamp(url):
+    """Timestamp a 14 cifre di un URL di cattura, o None"""
+    match = re.search(r'web\.archive\.org/web/(\d{14})', url or '')
+    return match.group(1) if match else None
+
+
+def image_capture_url(url, timestamp):
+    """
+    URL di cattura dell'immagine url al timestamp dato (con im_, che
+    restituisce il file originale), così che finisca in cache. Un URL che è
+    già una cattura, o senza timestamp, viene ritornato così com'è.
+    """
+    if 'web.archive.org' in url or not timestamp:
+        return url
+    return f"https://web.archive.org/web/{timestamp}im_/{url}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES blobs(digest),
+    content_type TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used);
+CREATE INDEX IF NOT EXISTS responses_digest ON responses(digest);
+"""
+
+
+class HTTPCache:
+    """
+    Cache delle risposte in un database SQLite, indirizzata per contenuto.
+
+    Ogni URL (esattamente come richiesto) punta all'hash SHA-256 del suo
+    contenuto, e ogni contenuto è salvato una volta sola: la stessa
+    immagine catturata a due URL diversi occupa spazio una volta. Quando il
+    totale supera max_size byte vengono eliminati gli URL usati meno di
+    recente, e i contenuti rimasti senza URL; un contenuto più grande di
+    max_size non viene salvato affatto. Si può usare da più thread.
+    """
+
+    def __init__(self, path, max_size=1 << 30):
+        self.path = str(path)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'too_large': 0,
+                      'uncached': 0, 'bytes_served': 0}
+
+    def get(self, url):
+        """Contenuto in cache per url, o None"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT blobs.data FROM responses JOIN blobs USING (digest) WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+            self.stats['hits'] += 1
+            self.stats['bytes_served'] += len(row[0])
+            return bytes(row[0])
+
+    def put(self, url, content, content_type=''):
+        """Salva il contenuto scaricato da url, poi libera spazio se serve"""
+        if len(content) > self.max_size:
+            # Svuoterebbe tutta la cache senza starci comunque
+            with self.lock:
+                self.stats['too_large'] += 1
+            return
+        digest = hashlib.sha256(content).hexdigest()
+        now = time.time()
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is None:
+                self.db.execute("INSERT INTO blobs (digest, size, data) VALUES (?, ?, ?)",
+                                (digest, len(content), content))
+                self.size += len(content)
+            previous = self.db.execute("SELECT digest FROM responses WHERE url = ?", (url,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (url, digest, content_type, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (url, digest, content_type, now, now))
+            if previous is not None and previous[0] != digest:
+                self._drop_orphan(previous[0])
+            self.stats['stored'] += 1
+            self._evict()
+            self.db.commit()
+
+    def fetch(self, url, get):
+        """
+        Contenuto di url: dalla cache, oppure chiamando get(url) (che deve
+        ritornare una risposta requests) e salvando il risultato. Solo le
+        risposte andate a buon fine vengono salvate, e solo per gli URL di
+        catture a timestamp fisso (CAPTURE_URL): tutti gli altri, come un
+        feed ancora online, possono cambiare e vengono sempre scaricati.
+        """
+        if not CAPTURE_URL.match(url):
+            with self.lock:
+                self.stats['uncached'] += 1
+            response = get(url)
+            response.raise_for_status()
+            return response.content
+
+        content = self.get(url)
+        if content is None:
+            response = get(url)
+            response.raise_for_status()
+            content = response.content
+            self.put(url, content, response.headers.get('Content-Type', ''))
+        return content
+
+    def _drop_orphan(self, digest):
+        """Elimina un contenuto se nessun URL lo usa più"""
+        if self.db.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        row = self.db.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self.size -= row[0]
+
+    def _evict(self):
+        """Elimina gli URL usati meno di recente finché il totale rientra in max_size"""
+        while self.size > self.max_size:
+            row = self.db.execute(
+                "SELECT url, digest FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.db.execute("DELETE FROM responses WHERE url = ?", (row[0],))
+            self._drop_orphan(row[1])
+            self.stats['evicted'] += 1
+
+    def entries(self):
+        """Numero di URL in cache"""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def format_stats(self):
+        """Riepilogo leggibile delle statistiche di questa esecuzione"""
+        requests = self.stats['hits'] + self.stats['misses']
+        ratio = self.stats['hits'] / requests * 100 if requests else 0.0
+        return (f"Cache HTTP: {self.stats['hits']} hit, {self.stats['misses']} miss "
+                f"({ratio:.1f}% hit), {self.stats['stored']} salvate, "
+                f"{self.stats['evicted']} eliminate, {self.stats['too_large']} troppo grandi, "
+                f"{self.stats['uncached']} fuori cache; {self.entries()} URL, "
+                f"{self.size / 1e6:.1f} MB in {self.path}")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def add_cache_arguments(parser):
+    """Opzioni della cache comuni a tutti gli scraper"""
+    parser.add_argument('--cache', metavar='PATH',
+                        help=f'database della cache delle risposte (default: {CACHE_NAME} '
+                             'nella directory di output)')
+    parser.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                        help='dimensione massima della cache, oltre la quale si eliminano '
+                             'gli URL usati meno di recente (default: %(default)s)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='scarica tutto dalla rete senza leggere né scrivere la cache')
+
+
+def open_cache(args):
+    """La HTTPCache richiesta dalle opzioni, o None con --no-cache"""
+    if not args.use_cache:
+        return None
+    path = Path(args.cache or Path(args.output) / CACHE_NAME)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return HTTPCache(path, args.cache_size * 1024 * 1024)
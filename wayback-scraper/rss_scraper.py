@@ -4,8 +4,10 @@ Scraper per estrarre contenuti da feed RSS archiviati su Wayback Machine
 Specifico per la Biblioteca Archimedica
 """
 
+import argparse
 import os
 import re
+import sys
 import json
 import requests
 from bs4 import BeautifulSoup
@@ -14,11 +16,80 @@ from pathlib import Path
 from urllib.parse import urlparse
 import html
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from templates import Template  # noqa: E402
+from profiling import add_profile_argument, profiling  # noqa: E402
+from http_cache import (  # noqa: E402
+    add_cache_arguments, capture_timestamp, image_capture_url, open_cache)
+
+# URL del feed RSS archiviato
+FEED_URL = "https://web.archive.org/web/20190221002126/http://biblioteca.archimedica.eu/old/feed/"
+
+# Pagina HTML di un singolo articolo
+ARTICLE_HTML = Template(
+    "<h1>{{title}}</h1>\n"
+    "<p><strong>Data:</strong> {{date}}</p>\n"
+    "<p><strong>Autore:</strong> {{author}}</p>\n"
+    "<hr>\n{{content_html|raw}}"
+)
+
+# Riepilogo Markdown: intestazione, poi una sezione per articolo
+SUMMARY_MD = Template(
+    "# Biblioteca Archimedica - Contenuti Recuperati\n\n"
+    "Scraping effettuato: {{scraped}}\n\n"
+    "Totale articoli: {{total}}\n\n"
+    "---\n\n"
+    "{{articles}}",
+    default='raw'
+)
+SUMMARY_MD_ARTICLE = Template(
+    "## {{number}}. {{title}}\n\n"
+    "**Data**: {{date}}\n\n"
+    "**Autore**: {{author}}\n\n"
+    "**URL**: {{url}}\n\n"
+    "{{categories}}"
+    "{{images}}"
+    "{{preview}}...\n\n"
+    "---\n\n",
+    default='raw'
+)
+SUMMARY_MD_CATEGORIES = Template("**Categorie**: {{categories}}\n\n", default='raw')
+SUMMARY_MD_IMAGES = Template("**Immagini**: {{count}}\n\n", default='raw')
+
+# Archivio HTML completo
+INDEX_HTML = Template(
+    "<!DOCTYPE html>\n<html lang='it'>\n<head>\n"
+    "<meta charset='UTF-8'>\n"
+    "<title>Biblioteca Archimedica - Archivio</title>\n"
+    "<style>\n"
+    "body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }\n"
+    "article { margin-bottom: 40px; padding-bottom: 20px; border-bottom: 1px solid #ccc; }\n"
+    "img { max-width: 100%; height: auto; }\n"
+    "</style>\n"
+    "</head>\n<body>\n"
+    "<h1>Biblioteca Archimedica - Archivio Completo</h1>\n"
+    "<p>Recuperato il {{scraped}}</p>\n"
+    "<p><strong>Totale articoli: {{total}}</strong></p>\n"
+    "<hr>\n"
+    "{{articles|raw}}"
+    "</body>\n</html>\n"
+)
+INDEX_HTML_ARTICLE = Template(
+    "<article>\n"
+    "<h2>{{title}}</h2>\n"
+    "<p><strong>Data:</strong> {{date}} | <strong>Autore:</strong> {{author}}</p>\n"
+    "{{content_html|raw}}\n"
+    "</article>\n"
+)
+
 
 class RSSFeedScraper:
-    def __init__(self, feed_url, output_dir="biblioteca"):
+    def __init__(self, feed_url, output_dir="biblioteca", cache=None):
         self.feed_url = feed_url
+        # Le immagini si scaricano dalla cattura allo stesso timestamp del feed
+        self.timestamp = capture_timestamp(feed_url)
         self.output_dir = Path(output_dir)
+        self.cache = cache
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
@@ -31,13 +102,23 @@ class RSSFeedScraper:
 
         self.articles = []
 
+    def get(self, url):
+        """GET con la sessione condivisa"""
+        return self.session.get(url, timeout=30)
+
+    def fetch(self, url):
+        """Contenuto di url, dalla cache (HTTPCache) se c'è, altrimenti dalla rete"""
+        if self.cache is not None:
+            return self.cache.fetch(url, self.get)
+        response = self.get(url)
+        response.raise_for_status()
+        return response.content
+
     def fetch_feed(self):
         """Scarica il feed RSS"""
         try:
             print(f"Scarico feed: {self.feed_url}")
-            response = self.session.get(self.feed_url, timeout=30)
-            response.raise_for_status()
-            return BeautifulSoup(response.content, 'xml')
+            return BeautifulSoup(self.fetch(self.feed_url), 'xml')
         except Exception as e:
             print(f"Errore nel scaricare il feed: {e}")
             return None
@@ -46,12 +127,11 @@ class RSSFeedScraper:
         """Scarica un'immagine"""
         try:
             print(f"  Scarico immagine: {filename}")
-            response = self.session.get(img_url, timeout=30)
-            response.raise_for_status()
+            content = self.fetch(image_capture_url(img_url, self.timestamp))
 
             img_path = self.output_dir / "images" / filename
             with open(img_path, 'wb') as f:
-                f.write(response.content)
+                f.write(content)
 
             return str(img_path)
         except Exception as e:
@@ -177,15 +257,33 @@ class RSSFeedScraper:
                 # Salva anche versione HTML
                 html_path = self.output_dir / "articles" / f"{filename}.html"
                 with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(f"<h1>{article['title']}</h1>\n")
-                    f.write(f"<p><strong>Data:</strong> {article['date']}</p>\n")
-                    f.write(f"<p><strong>Autore:</strong> {article['author']}</p>\n")
-                    f.write(f"<hr>\n{article['content_html']}")
+                    ARTICLE_HTML.write(f, **article)
 
                 print(f"✓ Salvato: {article['title']}")
 
         return self.articles
 
+    def _summary_md_values(self, number, article):
+        """Valori per la sezione Markdown di un articolo"""
+        categories = ''
+        if article['categories']:
+            categories = SUMMARY_MD_CATEGORIES.render(categories=', '.join(article['categories']))
+
+        images = ''
+        if article['images']:
+            images = SUMMARY_MD_IMAGES.render(count=len(article['images']))
+
+        return {
+            'number': number,
+            'title': article['title'],
+            'date': article['date'],
+            'author': article['author'],
+            'url': article['url'],
+            'categories': categories,
+            'images': images,
+            'preview': article['content_text'][:500],
+        }
+
     def save_summary(self):
         """Salva riepilogo completo"""
         summary = {
@@ -205,70 +303,55 @@ class RSSFeedScraper:
         # Markdown
         md_path = self.output_dir / "summary.md"
         with open(md_path, 'w', encoding='utf-8') as f:
-            f.write("# Biblioteca Archimedica - Contenuti Recuperati\n\n")
-            f.write(f"Scraping effettuato: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write(f"Totale articoli: {len(self.articles)}\n\n")
-            f.write("---\n\n")
-
-            for i, article in enumerate(self.articles, 1):
-                f.write(f"## {i}. {article['title']}\n\n")
-                f.write(f"**Data**: {article['date']}\n\n")
-                f.write(f"**Autore**: {article['author']}\n\n")
-                f.write(f"**URL**: {article['url']}\n\n")
-
-                if article['categories']:
-                    f.write(f"**Categorie**: {', '.join(article['categories'])}\n\n")
-
-                if article['images']:
-                    f.write(f"**Immagini**: {len(article['images'])}\n\n")
-
-                # Anteprima contenuto
-                preview = article['content_text'][:500]
-                f.write(f"{preview}...\n\n")
-                f.write("---\n\n")
+            SUMMARY_MD.write(
+                f,
+                scraped=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                total=len(self.articles),
+                articles=SUMMARY_MD_ARTICLE.render_each(
+                    self._summary_md_values(i, article)
+                    for i, article in enumerate(self.articles, 1)
+                ),
+            )
 
         print(f"✓ Riepilogo Markdown salvato in: {md_path}")
 
         # HTML completo
         html_path = self.output_dir / "index.html"
         with open(html_path, 'w', encoding='utf-8') as f:
-            f.write("<!DOCTYPE html>\n<html lang='it'>\n<head>\n")
-            f.write("<meta charset='UTF-8'>\n")
-            f.write("<title>Biblioteca Archimedica - Archivio</title>\n")
-            f.write("<style>\n")
-            f.write("body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }\n")
-            f.write("article { margin-bottom: 40px; padding-bottom: 20px; border-bottom: 1px solid #ccc; }\n")
-            f.write("img { max-width: 100%; height: auto; }\n")
-            f.write("</style>\n")
-            f.write("</head>\n<body>\n")
-            f.write("<h1>Biblioteca Archimedica - Archivio Completo</h1>\n")
-            f.write(f"<p>Recuperato il {datetime.now().strftime('%d/%m/%Y alle %H:%M')}</p>\n")
-            f.write(f"<p><strong>Totale articoli: {len(self.articles)}</strong></p>\n")
-            f.write("<hr>\n")
-
-            for article in self.articles:
-                f.write("<article>\n")
-                f.write(f"<h2>{article['title']}</h2>\n")
-                f.write(f"<p><strong>Data:</strong> {article['date']} | <strong>Autore:</strong> {article['author']}</p>\n")
-                f.write(f"{article['content_html']}\n")
-                f.write("</article>\n")
-
-            f.write("</body>\n</html>\n")
+            INDEX_HTML.write(
+                f,
+                scraped=datetime.now().strftime('%d/%m/%Y alle %H:%M'),
+                total=len(self.articles),
+                articles=INDEX_HTML_ARTICLE.render_each(self.articles),
+            )
 
         print(f"✓ Archivio HTML completo salvato in: {html_path}")
 
 
 def main():
-    # URL del feed RSS archiviato
-    feed_url = "https://web.archive.org/web/20190221002126/http://biblioteca.archimedica.eu/old/feed/"
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('feed_url', nargs='?', default=FEED_URL,
+                        help='feed RSS archiviato da scaricare (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='biblioteca',
+                        help='directory di output (default: %(default)s)')
+    add_cache_arguments(parser)
+    add_profile_argument(parser)
+    args = parser.parse_args()
 
+    with profiling(args.profile, args.output):
+        run(args)
+
+
+def run(args):
+    """Scarica il feed e salva gli articoli con le opzioni della riga di comando"""
     print("=" * 70)
     print("RSS FEED SCRAPER - BIBLIOTECA ARCHIMEDICA")
     print("=" * 70)
-    print(f"\nFeed URL: {feed_url}")
-    print(f"Output directory: biblioteca/\n")
+    print(f"\nFeed URL: {args.feed_url}")
+    print(f"Output directory: {args.output}/\n")
 
-    scraper = RSSFeedScraper(feed_url, output_dir="biblioteca")
+    cache = open_cache(args)
+    scraper = RSSFeedScraper(args.feed_url, output_dir=args.output, cache=cache)
 
     # Scarica e parse feed
     soup = scraper.fetch_feed()
@@ -286,6 +369,10 @@ def main():
     print(f"- Riepilogo: {scraper.output_dir / 'summary.json'}")
     print(f"- Archivio completo: {scraper.output_dir / 'index.html'}")
 
+    if cache is not None:
+        print(f"\n{cache.format_stats()}")
+        cache.close()
+
 
 if __name__ == "__main__":
     main()
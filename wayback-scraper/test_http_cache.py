@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test della cache HTTP: una seconda esecuzione sugli stessi URL non deve
+fare nessuna richiesta di rete
+"""
+
+import tempfile
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from http_cache import HTTPCache
+from rss_scraper import RSSFeedScraper
+from wayback_scraper import WaybackScraper
+
+FEED_URL = "https://web.archive.org/web/20190221002126/http://biblioteca.archimedica.eu/old/feed/"
+PAGE_URL = "https://web.archive.org/web/20190428235901/http://biblioteca.archimedica.eu/old/articolo/"
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/"
+     xmlns:dc="http://purl.org/dc/elements/1.1/">
+<channel>
+<item>
+<title>Articolo</title>
+<link>http://biblioteca.archimedica.eu/old/articolo/</link>
+<pubDate>Fri, 10 Nov 2006 14:51:57 +0000</pubDate>
+<dc:creator>Archimedix</dc:creator>
+<content:encoded><![CDATA[<p>Testo</p>
+<img src="https://web.archive.org/web/20190221002126/http://biblioteca.archimedica.eu/a.jpg">
+<img src="http://biblioteca.archimedica.eu/b.png">]]></content:encoded>
+</item>
+</channel>
+</rss>
+"""
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeNetwork:
+    """Sostituto di get(): risponde a tutto e conta le richieste"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url):
+        self.requests.append(url)
+        return FakeResponse(FEED.encode('utf-8') if url == FEED_URL else b'image ' + url.encode())
+
+
+def run_rss(output_dir, cache, get):
+    scraper = RSSFeedScraper(FEED_URL, output_dir, cache=cache)
+    scraper.get = get
+    scraper.parse_feed(scraper.fetch_feed())
+    return scraper
+
+
+def test_rss_rerun_makes_no_requests():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = HTTPCache(Path(tmp) / 'cache.sqlite')
+        network = FakeNetwork()
+        first = run_rss(tmp, cache, network.get)
+        assert len(network.requests) == 3
+        assert all('/web/20190221002126' in url for url in network.requests)
+        # L'URL originale resta quello senza prefisso
+        assert first.articles[0]['images'][0]['original_url'] == 'http://biblioteca.archimedica.eu/a.jpg'
+
+        # Gli errori di rete vengono solo stampati: si contano le richieste
+        cache.stats['misses'] = 0
+        offline = FakeNetwork()
+        second = run_rss(tmp, cache, offline.get)
+        assert offline.requests == []
+        assert cache.stats['misses'] == 0
+        assert len(second.articles[0]['images']) == 2
+        cache.close()
+
+
+def test_wayback_images_without_base_timestamp_are_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = HTTPCache(Path(tmp) / 'cache.sqlite')
+        soup = BeautifulSoup('<div class="entry-content"><p>Testo</p>'
+                             '<img src="http://biblioteca.archimedica.eu/c.jpg"></div>', 'html.parser')
+
+        runs = [FakeNetwork(), FakeNetwork()]
+        for network in runs:
+            scraper = WaybackScraper("http://biblioteca.archimedica.eu/old/", tmp, cache=cache)
+            scraper.get = network.get
+            cache.stats['misses'] = 0
+            article = scraper.extract_article_data(soup, PAGE_URL)
+
+        assert runs[0].requests == [
+            "https://web.archive.org/web/20190428235901im_/http://biblioteca.archimedica.eu/c.jpg"]
+        assert runs[1].requests == []
+        assert cache.stats['misses'] == 0
+        assert len(article['images']) == 1
+        cache.close()
+
+
+if __name__ == '__main__':
+    test_rss_rerun_makes_no_requests()
+    test_wayback_images_without_base_timestamp_are_cached()
+    print("All tests passed!")
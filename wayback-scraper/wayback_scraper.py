@@ -4,28 +4,118 @@ Scraper per recuperare contenuti da siti archiviati su Wayback Machine
 Estrae testi, immagini e date da pagine WordPress archiviate
 """
 
+import argparse
 import os
 import re
+import sys
 import json
+import threading
 import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin, urlparse, unquote
 from datetime import datetime
 from pathlib import Path
 import time
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from templates import Template  # noqa: E402
+from profiling import add_profile_argument, profiling  # noqa: E402
+from http_cache import (  # noqa: E402
+    add_cache_arguments, capture_timestamp, image_capture_url, open_cache)
+
+# URL del sito su Wayback Machine (usando snapshot del 2019 che è più completo)
+WAYBACK_URL = "https://web.archive.org/web/20190428235901/http://biblioteca.archimedica.eu/old/"
+
+# Riepilogo Markdown: intestazione, poi una sezione per articolo
+SUMMARY_MD = Template(
+    "# Contenuti recuperati da {{original_url}}\n\n"
+    "Scraping effettuato: {{scraped}}\n\n"
+    "Totale articoli: {{total}}\n\n"
+    "---\n\n"
+    "{{articles}}",
+    default='raw'
+)
+SUMMARY_MD_ARTICLE = Template(
+    "## {{number}}. {{title}}\n\n"
+    "{{date}}"
+    "**URL**: {{url}}\n\n"
+    "{{images}}"
+    "{{preview}}...\n\n"
+    "---\n\n",
+    default='raw'
+)
+SUMMARY_MD_DATE = Template("**Data**: {{date}}\n\n", default='raw')
+SUMMARY_MD_IMAGES = Template("**Immagini**: {{count}}\n\n", default='raw')
+
+
+class TokenBucket:
+    """
+    Token bucket: al massimo `rate` richieste al secondo in media, con
+    raffiche fino a `burst` richieste.
+
+    Chi chiama acquire() prenota un gettone anche se non è ancora
+    disponibile (il saldo può andare sotto zero) e aspetta fuori dal lock
+    il tempo necessario, così più thread si mettono in coda senza
+    superare il ritmo complessivo.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Attende il proprio turno; ritorna i secondi di attesa"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class HostRateLimiter:
+    """Un TokenBucket per ogni host, creato alla prima richiesta"""
+
+    def __init__(self, rate=1.0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """Attende finché una richiesta a url rientra nel limite del suo host"""
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket.acquire()
+
 
 class WaybackScraper:
-    def __init__(self, base_url, output_dir="scraped_content"):
+    def __init__(self, base_url, output_dir="scraped_content", rate=1.0, burst=1, cache=None):
         """
         Inizializza lo scraper
 
         Args:
             base_url: URL della Wayback Machine (es. https://web.archive.org/web/20201229235150/https://biblioteca.archimedica.eu/old)
             output_dir: Directory dove salvare i contenuti
+            rate: Richieste al secondo consentite verso ciascun host (pagine e immagini insieme)
+            burst: Richieste consecutive consentite senza attesa
+            cache: HTTPCache da cui leggere le risposte già scaricate (None = sempre dalla rete)
         """
         self.base_url = base_url
         self.output_dir = Path(output_dir)
+        self.limiter = HostRateLimiter(rate, burst)
+        self.cache = cache
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
@@ -48,6 +138,22 @@ class WaybackScraper:
         self.scraped_urls = set()
         self.articles = []
 
+    def get(self, url):
+        """GET con la sessione condivisa, nel rispetto del limite per host"""
+        self.limiter.wait(url)
+        return self.session.get(url, timeout=30)
+
+    def fetch(self, url):
+        """
+        Contenuto di url: dalla cache se c'è, senza attendere il limite né
+        toccare la rete, altrimenti scaricato con get() e salvato in cache
+        """
+        if self.cache is not None:
+            return self.cache.fetch(url, self.get)
+        response = self.get(url)
+        response.raise_for_status()
+        return response.content
+
     def get_wayback_url(self, url):
         """Converte un URL normale in URL Wayback Machine"""
         if 'web.archive.org' in url:
@@ -67,27 +173,25 @@ class WaybackScraper:
         """Scarica una pagina e ritorna BeautifulSoup object"""
         try:
             print(f"Scarico: {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            return BeautifulSoup(response.content, 'html.parser')
+            return BeautifulSoup(self.fetch(url), 'html.parser')
         except Exception as e:
             print(f"Errore nel scaricare {url}: {e}")
             return None
 
-    def download_image(self, img_url, filename):
-        """Scarica un'immagine"""
+    def download_image(self, img_url, filename, page_url=None):
+        """
+        Scarica un'immagine, dalla sua cattura al timestamp di base_url o,
+        se manca, a quello della pagina page_url in cui compare
+        """
         try:
-            # Converti in URL Wayback se necessario
-            if 'web.archive.org' not in img_url:
-                img_url = self.get_wayback_url(img_url)
+            img_url = image_capture_url(img_url, self.timestamp or capture_timestamp(page_url))
 
             print(f"  Scarico immagine: {filename}")
-            response = self.session.get(img_url, timeout=30)
-            response.raise_for_status()
+            content = self.fetch(img_url)
 
             img_path = self.output_dir / "images" / filename
             with open(img_path, 'wb') as f:
-                f.write(response.content)
+                f.write(content)
 
             return str(img_path)
         except Exception as e:
@@ -157,7 +261,7 @@ class WaybackScraper:
                         img_filename = f"image_{len(article_data['images'])}.jpg"
 
                     # Scarica immagine
-                    img_path = self.download_image(img_src, img_filename)
+                    img_path = self.download_image(img_src, img_filename, url)
                     if img_path:
                         article_data['images'].append({
                             'original_url': img_src,
@@ -231,10 +335,59 @@ class WaybackScraper:
                 to_scrape.extend([l for l in new_links if l not in self.scraped_urls])
 
             scraped_count += 1
-            time.sleep(1)  # Pausa per non sovraccaricare il server
 
         print(f"\nScraping completato: {scraped_count} pagine, {len(self.articles)} articoli")
 
+    def scrape_concurrent(self, start_url, max_pages=100, workers=8):
+        """
+        Scrape del sito con un pool di `workers` thread che condividono la
+        sessione (e le sue connessioni).
+
+        Il thread principale tiene la coda: appena una pagina è finita, i
+        suoi link nuovi vengono assegnati ai thread liberi, fino a
+        max_pages pagine. Il ritmo lo decide solo il limite per host,
+        quindi con abbastanza thread si arriva al numero di richieste al
+        secondo consentito invece di una richiesta ogni (latenza + pausa).
+        Gli articoli vengono raccolti nell'ordine in cui le pagine finiscono.
+        """
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        scheduled = {start_url}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(self.scrape_page, start_url)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for link in future.result() or []:
+                        if len(scheduled) >= max_pages:
+                            break
+                        if link not in scheduled:
+                            scheduled.add(link)
+                            pending.add(executor.submit(self.scrape_page, link))
+
+        print(f"\nScraping completato: {len(scheduled)} pagine, {len(self.articles)} articoli")
+
+    def _summary_md_values(self, number, article):
+        """Valori per la sezione Markdown di un articolo"""
+        date = ''
+        if article['date']:
+            date = SUMMARY_MD_DATE.render(date=article['date'])
+
+        images = ''
+        if article['images']:
+            images = SUMMARY_MD_IMAGES.render(count=len(article['images']))
+
+        return {
+            'number': number,
+            'title': article['title'],
+            'date': date,
+            'url': article['url'],
+            'images': images,
+            'preview': article['content'][:300],
+        }
+
     def save_summary(self):
         """Salva un riepilogo di tutti gli articoli"""
         summary = {
@@ -254,40 +407,63 @@ class WaybackScraper:
         # Crea anche un file markdown leggibile
         md_path = self.output_dir / "summary.md"
         with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(f"# Contenuti recuperati da {self.original_url}\n\n")
-            f.write(f"Scraping effettuato: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write(f"Totale articoli: {len(self.articles)}\n\n")
-            f.write("---\n\n")
-
-            for i, article in enumerate(self.articles, 1):
-                f.write(f"## {i}. {article['title']}\n\n")
-                if article['date']:
-                    f.write(f"**Data**: {article['date']}\n\n")
-                f.write(f"**URL**: {article['url']}\n\n")
-                if article['images']:
-                    f.write(f"**Immagini**: {len(article['images'])}\n\n")
-                f.write(f"{article['content'][:300]}...\n\n")
-                f.write("---\n\n")
+            SUMMARY_MD.write(
+                f,
+                original_url=self.original_url,
+                scraped=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                total=len(self.articles),
+                articles=SUMMARY_MD_ARTICLE.render_each(
+                    self._summary_md_values(i, article)
+                    for i, article in enumerate(self.articles, 1)
+                ),
+            )
 
         print(f"✓ Riepilogo markdown salvato in: {md_path}")
 
 
 def main():
     """Funzione principale"""
-    # URL del sito su Wayback Machine (usando snapshot del 2019 che è più completo)
-    wayback_url = "https://web.archive.org/web/20190428235901/http://biblioteca.archimedica.eu/old/"
-
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('url', nargs='?', default=WAYBACK_URL,
+                        help='snapshot Wayback Machine da cui partire (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='biblioteca',
+                        help='directory di output (default: %(default)s)')
+    parser.add_argument('--max-pages', type=int, default=50,
+                        help='numero massimo di pagine da scaricare (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='thread che scaricano in parallelo; 1 = una pagina alla volta '
+                             '(default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='richieste al secondo consentite verso ciascun host '
+                             '(default: %(default)s)')
+    parser.add_argument('--burst', type=int, default=1,
+                        help='richieste consecutive consentite senza attesa (default: %(default)s)')
+    add_cache_arguments(parser)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.output):
+        run(args)
+
+
+def run(args):
+    """Esegue lo scraping con le opzioni della riga di comando"""
     print("=" * 70)
     print("WAYBACK MACHINE SCRAPER")
     print("=" * 70)
-    print(f"\nURL: {wayback_url}")
-    print(f"Output directory: biblioteca/")
+    print(f"\nURL: {args.url}")
+    print(f"Output directory: {args.output}/")
     print("\nAvvio scraping...\n")
 
-    scraper = WaybackScraper(wayback_url, output_dir="biblioteca")
+    cache = open_cache(args)
+    scraper = WaybackScraper(args.url, output_dir=args.output, rate=args.rate, burst=args.burst,
+                             cache=cache)
 
     # Scrape il sito
-    scraper.scrape_recursive(wayback_url, max_pages=50)
+    if args.workers > 1:
+        scraper.scrape_concurrent(args.url, max_pages=args.max_pages, workers=args.workers)
+    else:
+        scraper.scrape_recursive(args.url, max_pages=args.max_pages)
 
     # Salva riepilogo
     scraper.save_summary()
@@ -301,6 +477,10 @@ def main():
     print(f"- Riepilogo: {scraper.output_dir / 'summary.json'}")
     print(f"- Riepilogo MD: {scraper.output_dir / 'summary.md'}")
 
+    if cache is not None:
+        print(f"\n{cache.format_stats()}")
+        cache.close()
+
 
 if __name__ == "__main__":
     main()